@@ -447,6 +447,9 @@ void captureAndRecognize() {
           blinkDouble();  // Already marked
         } else if (strcmp(ledPattern, "error_blink") == 0) {
           blinkError();  // Wrong bus
+        } else if (strcmp(ledPattern, "busy_blink") == 0) {
+          blinkDouble();  // Server busy - back off before the next capture
+          delay((doc["retry_after"] | 2) * 1000);
         } else {
           blinkSlow();  // Unknown person
         }
@@ -5,10 +5,52 @@ class Settings(BaseSettings):
     MONGO_URI: str
     MONGO_DB: str = "tripsync"
     JWT_SECRET: str = "change_me"
+    JWT_ACCESS_MINUTES: int = 15              # lifetime of claims access tokens
+    JWT_REFRESH_DAYS: int = 7                 # lifetime of refresh tokens
+    PRINCIPAL_CACHE_SIZE: int = 1024          # authenticated users kept in memory (0 disables)
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 30   # how long a cached user is trusted
+    PASSWORD_HASH_WORKERS: int = 2            # concurrent bcrypt hash/verify calls
+    PASSWORD_HASH_QUEUE_DEPTH: int = 256      # waiting calls before 503
     SECRET_KEY: str = "change_me"
     APP_HOST: str = "0.0.0.0"
     APP_PORT: int = 3000
 
+    # MQTT location ingestion
+    MQTT_FLUSH_INTERVAL: float = 1.0  # seconds between bulk writes
+    MQTT_BATCH_SIZE: int = 500        # fixes that end a window early; also the bulk_write chunk size
+    MQTT_QUEUE_SIZE: int = 10000      # pending messages before dropping
+
+    # Location history retention per tier (days)
+    HISTORY_RAW_RETENTION_DAYS: int = 7
+    HISTORY_1M_RETENTION_DAYS: int = 30
+    HISTORY_15M_RETENTION_DAYS: int = 365
+    ETA_LEARN_DAYS: int = 7           # history replayed at startup when no ETA statistics are stored
+
+    # Face inference pool
+    FACE_EXECUTOR: str = "thread"     # "thread" or "process"
+    FACE_WORKERS: int = 2
+    FACE_QUEUE_DEPTH: int = 8         # waiting requests before 503
+    FACE_WARMUP: bool = True          # load the model at startup; /ready waits for it
+    FACE_SAVE_IMAGES: bool = True     # keep enrollment photos in student_faces/
+    FACE_BATCH_WINDOW_MS: float = 20  # how long a face waits for others to batch with
+    FACE_BATCH_SIZE: int = 8          # faces per embedding forward pass (1 disables batching)
+    FACE_CACHE_SIZE: int = 256        # duplicate-frame cache entries (0 disables)
+    FACE_CACHE_TTL_SECONDS: float = 10
+    FACE_REBUILD_WORKERS: int = 2     # processes re-encoding images in a rebuild
+    FACE_REBUILD_CHUNK: int = 32      # images per worker task
+
+    # Face detector cascade pre-filter (defaults; overridable per bus)
+    FACE_CASCADE: bool = True
+    FACE_PREFILTER_WIDTH: int = 320   # frames are downscaled to this width for stage 1
+    FACE_MIN_FACE_PX: int = 60        # smaller faces (in original pixels) are rejected
+    FACE_MIN_SHARPNESS: float = 30    # Laplacian variance of the face; lower is blurry
+
+    # Face gallery search
+    FACE_SEARCH: str = "exact"        # "exact" or "ivf" (approximate)
+    FACE_IVF_LISTS: int = 0           # clusters; 0 = sqrt(encodings)
+    FACE_IVF_PROBES: int = 8          # clusters scanned per frame
+    FACE_IVF_MIN_SIZE: int = 2000     # smaller galleries are always searched exactly
+
     class Config:
         env_file = ".env"
         extra = "ignore"
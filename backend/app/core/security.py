@@ -1,8 +1,11 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Dict, Optional
 import jwt
 from passlib.context import CryptContext
-from ..core.config import get_settings
+from ..core.config import Settings, get_settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -15,6 +18,104 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+class PasswordHasherBusy(Exception):
+    """Raised when too many hash/verify calls are queued; callers should back off"""
+    def __init__(self, retry_after: int = 1):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small dedicated thread pool (bcrypt releases the GIL),
+    so a login storm never blocks the event loop. At most workers calls
+    run at once; beyond workers + queue_depth callers get PasswordHasherBusy.
+    """
+    def __init__(self):
+        self.executor: Optional[ThreadPoolExecutor] = None
+        # Until start() reads the settings, use their declared defaults
+        self.workers = Settings.model_fields["PASSWORD_HASH_WORKERS"].default
+        self.queue_depth = self.workers + Settings.model_fields["PASSWORD_HASH_QUEUE_DEPTH"].default
+        self.pending = 0
+        self.peak_pending = 0
+        self.stats = {
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "wait_seconds": 0.0,
+            "run_seconds": 0.0
+        }
+
+    def start(self):
+        """Create the pool from settings (called lazily on first use)"""
+        settings = get_settings()
+        self.workers = max(1, settings.PASSWORD_HASH_WORKERS)
+        self.queue_depth = self.workers + max(0, settings.PASSWORD_HASH_QUEUE_DEPTH)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+
+    async def _run(self, fn, *args):
+        if self.executor is None:
+            self.start()
+        if self.pending >= self.queue_depth:
+            self.stats["rejected"] += 1
+            raise PasswordHasherBusy()
+
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        submitted = time.perf_counter()
+
+        def timed_call():
+            started = time.perf_counter()
+            return fn(*args), started, time.perf_counter()
+
+        # Stats are only touched here on the event loop, never from the worker threads
+        try:
+            result, started, finished = await asyncio.get_running_loop().run_in_executor(self.executor, timed_call)
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self.pending -= 1
+        self.stats["completed"] += 1
+        self.stats["wait_seconds"] += started - submitted
+        self.stats["run_seconds"] += finished - started
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def get_stats(self) -> Dict[str, Any]:
+        completed = self.stats["completed"]
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "in_flight": min(self.pending, self.workers),
+            "queued": max(0, self.pending - self.workers),
+            "peak_pending": self.peak_pending,
+            "completed": completed,
+            "failed": self.stats["failed"],
+            "rejected": self.stats["rejected"],
+            "avg_wait_ms": round(self.stats["wait_seconds"] * 1000 / completed, 2) if completed else None,
+            "avg_run_ms": round(self.stats["run_seconds"] * 1000 / completed, 2) if completed else None
+        }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+# Global password hasher
+password_hasher = PasswordHasher()
+
+
+# User fields signed into claims tokens, enough to authorize without a users lookup
+CLAIM_FIELDS = ("role", "name", "roll_no", "assignedBus", "route", "boarding")
+
+
 def create_jwt(user_id: str, expires_in_hours: int = 24) -> str:
     settings = get_settings()
     payload = {
@@ -25,6 +126,38 @@ def create_jwt(user_id: str, expires_in_hours: int = 24) -> str:
     return jwt.encode(payload, settings.JWT_SECRET, algorithm="HS256")
 
 
+def create_access_token(user: dict) -> str:
+    """
+    Short-lived token carrying the user's claims and tokenVersion; bumping
+    tokenVersion (see principal_cache.revoke) invalidates it
+    """
+    settings = get_settings()
+    now = datetime.utcnow()
+    payload = {
+        "user_id": str(user["_id"]),
+        "type": "access",
+        "ver": user.get("tokenVersion", 0),
+        **{field: user[field] for field in CLAIM_FIELDS if user.get(field) is not None},
+        "exp": now + timedelta(minutes=settings.JWT_ACCESS_MINUTES),
+        "iat": now,
+    }
+    return jwt.encode(payload, settings.JWT_SECRET, algorithm="HS256")
+
+
+def create_refresh_token(user: dict) -> str:
+    """Long-lived token only accepted by /api/token/refresh"""
+    settings = get_settings()
+    now = datetime.utcnow()
+    payload = {
+        "user_id": str(user["_id"]),
+        "type": "refresh",
+        "ver": user.get("tokenVersion", 0),
+        "exp": now + timedelta(days=settings.JWT_REFRESH_DAYS),
+        "iat": now,
+    }
+    return jwt.encode(payload, settings.JWT_SECRET, algorithm="HS256")
+
+
 def decode_jwt(token: str) -> Optional[dict]:
     settings = get_settings()
     try:
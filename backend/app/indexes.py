@@ -0,0 +1,135 @@
+"""
+Index registry for every hot query shape in the routers.
+ensure_indexes() creates them idempotently at startup; verify_query_plans()
+runs explain() on a representative query of each shape and reports any
+plan that falls back to a collection scan (see verify_indexes.py).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+# collection -> [(keys, options)]
+INDEXES: Dict[str, List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]] = {
+    "users": [
+        ([("email", ASCENDING)], {"unique": True}),
+        # Only students have roll numbers
+        ([("roll_no", ASCENDING)], {"unique": True, "sparse": True}),
+        ([("role", ASCENDING), ("assignedBus", ASCENDING), ("name", ASCENDING)], {}),
+        ([("role", ASCENDING), ("route", ASCENDING)], {}),
+        ([("role", ASCENDING), ("name", ASCENDING)], {}),
+    ],
+    "buses": [
+        ([("number", ASCENDING)], {"unique": True}),
+        # Legacy field name; the MQTT location update matches either one in an $or
+        ([("busNumber", ASCENDING)], {}),
+        ([("driverId", ASCENDING)], {}),
+        ([("route", ASCENDING)], {}),
+    ],
+    "routes": [
+        ([("name", ASCENDING)], {}),
+    ],
+    "attendance": [
+        ([("roll_no", ASCENDING), ("date", ASCENDING)], {}),
+        ([("date", ASCENDING)], {}),
+        ([("busNumber", ASCENDING), ("timestamp", DESCENDING)], {}),
+        ([("name", ASCENDING), ("timestamp", DESCENDING)], {}),
+    ],
+    "messages": [
+        ([("groupId", ASCENDING), ("timestamp", DESCENDING)], {}),
+    ],
+    "groups": [
+        ([("groupId", ASCENDING)], {}),
+        ([("route", ASCENDING), ("recipientType", ASCENDING)], {}),
+    ],
+    "leave_requests": [
+        ([("driverId", ASCENDING), ("date", ASCENDING)], {}),
+        ([("status", ASCENDING), ("date", ASCENDING)], {}),
+    ],
+    "complaints": [
+        ([("studentId", ASCENDING), ("submittedAt", DESCENDING)], {}),
+        ([("status", ASCENDING), ("submittedAt", DESCENDING)], {}),
+    ],
+}
+
+# (name, collection, filter, sort) for each filtered query the routers issue.
+# Unfiltered listings (find({})) scan by design and are not included.
+QUERY_SHAPES: List[Tuple[str, str, Dict[str, Any], Optional[List[Tuple[str, int]]]]] = [
+    ("login / register by email", "users", {"email": "student@example.com"}, None),
+    ("student by roll_no", "users", {"roll_no": "22BCE7001", "role": "student"}, None),
+    ("students by roll_no list", "users", {"roll_no": {"$in": ["22BCE7001", "22BEC7044"]}}, None),
+    ("users by role", "users", {"role": "driver"}, None),
+    ("bus riders", "users", {"role": "student", "assignedBus": "AP29A1234"}, [("name", ASCENDING)]),
+    ("route riders", "users", {"role": "student", "route": "Route 1"}, None),
+    ("parent's child", "users", {"name": "Student Name", "role": "student"}, None),
+    ("bus by number", "buses", {"number": "AP29A1234"}, None),
+    ("MQTT location update", "buses", {"$or": [{"busNumber": "AP29A1234"}, {"number": "AP29A1234"}]}, None),
+    ("bus by driver", "buses", {"driverId": "64b000000000000000000000"}, None),
+    ("buses on route", "buses", {"route": "Route 1"}, None),
+    ("route by name", "routes", {"name": "Route 1"}, None),
+    ("attendance today for student", "attendance", {"roll_no": "22BCE7001", "date": "2024-01-01"}, None),
+    ("student attendance history", "attendance", {"roll_no": "22BCE7001"}, [("timestamp", DESCENDING)]),
+    ("attendance by date", "attendance", {"date": "2024-01-01"}, None),
+    ("attendance by bus", "attendance", {"busNumber": "AP29A1234"}, [("timestamp", DESCENDING)]),
+    ("attendance by child name", "attendance", {"name": "Student Name"}, [("timestamp", DESCENDING)]),
+    ("group messages", "messages", {"groupId": "route_Route 1"}, [("timestamp", DESCENDING)]),
+    ("group by id", "groups", {"groupId": "all_drivers"}, None),
+    ("driver groups", "groups", {"$or": [
+        {"groupId": "all_drivers"},
+        {"groupId": "driver_64b000000000000000000000_students"},
+        {"route": "Route 1", "recipientType": {"$in": ["drivers", "all"]}}
+    ]}, None),
+    ("driver leave on date", "leave_requests", {"driverId": "64b000000000000000000000", "date": "2024-01-01"}, None),
+    ("driver upcoming leaves", "leave_requests",
+     {"driverId": "64b000000000000000000000", "status": "approved", "date": {"$gte": "2024-01-01"}},
+     [("date", ASCENDING)]),
+    ("pending leaves", "leave_requests", {"status": "pending"}, None),
+    ("student complaints", "complaints", {"studentId": "64b000000000000000000000"}, [("submittedAt", DESCENDING)]),
+    ("pending complaints", "complaints", {"status": "pending"}, [("submittedAt", DESCENDING)]),
+]
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    """Create every registered index (no-op for ones that already exist)"""
+    created = 0
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                await db[collection].create_index(keys, **options)
+                created += 1
+            except OperationFailure as e:
+                # Duplicate data or a same-key index with other options: keep serving, report it
+                print(f"⚠ Index {collection}{keys} not created: {e}")
+    print(f"✓ Indexes ensured: {created} across {len(INDEXES)} collections")
+
+
+def plan_stages(plan: Any) -> List[str]:
+    """Every stage name in an explain() plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+async def verify_query_plans(db: AsyncIOMotorDatabase) -> List[Dict[str, Any]]:
+    """explain() every registered query shape; "ok" is False if its winning plan has a COLLSCAN"""
+    results = []
+    for name, collection, query, sort in QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        results.append({
+            "name": name,
+            "collection": collection,
+            "stages": stages,
+            "ok": "COLLSCAN" not in stages
+        })
+    return results
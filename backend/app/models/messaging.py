@@ -72,6 +72,14 @@ class BusUpdate(BaseModel):
     route: Optional[str] = None
 
 
+class FaceCascadeUpdate(BaseModel):
+    """Admin overrides the face detector cascade for one bus (unset fields use the defaults)"""
+    enabled: Optional[bool] = None
+    width: Optional[int] = None          # pre-filter frame width
+    min_face: Optional[int] = None       # minimum face size in pixels
+    min_sharpness: Optional[float] = None
+
+
 class DriverUpdate(BaseModel):
     """Admin updates driver details"""
     name: Optional[str] = None
@@ -13,10 +13,16 @@ class UserCreate(BaseModel):
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
+    claims: bool = False  # opt in to a short-lived claims token plus a refresh token
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenResponse(BaseModel):
     token: str
     role: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None  # seconds, for claims tokens
 
 class UserPublic(BaseModel):
     id: str = Field(alias="_id")
@@ -2,13 +2,19 @@
 Admin endpoints for system management and overview
 Manages buses, routes, students, drivers, leave requests
 """
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
 from typing import Optional, List
 from fastapi import APIRouter, Depends, HTTPException, Query
 from bson import ObjectId
 from ..db import get_db
 from .deps import get_current_user
 from ..models.messaging import LeaveApproval, StudentUpdate, BusUpdate, DriverUpdate, RouteCreate, RouteUpdate, StudentCreate
+from ..utils.live_fleet import live_fleet
+from ..utils.route_stops import route_stops
+from ..utils.coverage import coverage_maps
+from ..utils.principals import principal_cache
+from ..utils.admin_stats import dashboard_stats, drivers_by_id, route_summaries, students_per_bus, system_stats
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -47,44 +53,29 @@ async def get_admin_dashboard(
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access only")
     
-    # Count totals
-    total_buses = await db.buses.count_documents({})
-    total_students = await db.users.count_documents({"role": "student"})
-    total_drivers = await db.users.count_documents({"role": "driver"})
-    total_routes = await db.routes.count_documents({})
-    
-    # Count running buses (buses with assigned drivers)
-    buses_with_drivers = await db.buses.count_documents({"driverId": {"$exists": True, "$ne": None}})
-    
-    # Pending leave requests
-    pending_leaves = await db.leave_requests.count_documents({"status": "pending"})
-    
-    # Pending complaints
-    pending_complaints = await db.complaints.count_documents({"status": "pending"})
-    
-    # Get routes with bus count
-    routes_cursor = db.routes.find({}, {"_id": 0})
-    routes = []
-    async for route in routes_cursor:
-        route_name = route.get("name")
-        bus_count = await db.buses.count_documents({"route": route_name})
-        student_count = await db.users.count_documents({"role": "student", "route": route_name})
-        routes.append({
-            "name": route_name,
-            "busCount": bus_count,
-            "studentCount": student_count,
-            "stops": len(route.get("stops", []))
-        })
+    # One aggregation per collection, run concurrently
+    stats = await dashboard_stats(db)
+    buses, roles = stats["buses"], stats["users"]["roles"]
+    
+    routes = [
+        {
+            "name": route.get("name"),
+            "busCount": route["busCount"],
+            "studentCount": route["studentCount"],
+            "stops": route["stopCount"]
+        }
+        for route in stats["routes"]
+    ]
     
     return {
         "statistics": {
-            "totalBuses": total_buses,
-            "runningBuses": buses_with_drivers,
-            "totalStudents": total_students,
-            "totalDrivers": total_drivers,
-            "totalRoutes": total_routes,
-            "pendingLeaves": pending_leaves,
-            "pendingComplaints": pending_complaints
+            "totalBuses": buses["total"],
+            "runningBuses": buses["running"],
+            "totalStudents": roles.get("student", 0),
+            "totalDrivers": roles.get("driver", 0),
+            "totalRoutes": len(routes),
+            "pendingLeaves": stats["pending"]["leaves"],
+            "pendingComplaints": stats["pending"]["complaints"]
         },
         "routes": routes
     }
@@ -125,6 +116,7 @@ async def create_bus(
     }
     
     result = await db.buses.insert_one(new_bus)
+    live_fleet.upsert_bus(new_bus)
     
     return {
         "success": True,
@@ -155,43 +147,20 @@ async def get_all_buses(
     elif status == "idle":
         query["driverId"] = {"$exists": False}
     
-    cursor = db.buses.find(query, {"_id": 0})
-    buses = []
+    buses = await db.buses.find(query, {"_id": 0}).to_list(length=None)
     
-    async for bus in cursor:
-        bus_number = bus.get("number")
-        
-        # Get driver info
-        driver_info = None
-        if bus.get("driverId"):
-            try:
-                driver = await db.users.find_one(
-                    {"_id": ObjectId(bus["driverId"])},
-                    {"password": 0, "_id": 0}
-                )
-                if driver:
-                    driver_info = {
-                        "name": driver.get("name"),
-                        "email": driver.get("email"),
-                        "phone": driver.get("phone")
-                    }
-            except:
-                pass
-        
-        # Get student count
-        student_count = await db.users.count_documents({
-            "role": "student",
-            "assignedBus": bus_number
-        })
-        
-        # Add coverage points
-        from ..utils.coverage import get_coverage_points_for_bus
-        coverage = await get_coverage_points_for_bus(db, bus_number)
-        
-        bus["driver"] = driver_info
-        bus["studentCount"] = student_count
-        bus["coveragePoints"] = coverage
-        buses.append(bus)
+    # Drivers and student counts for every bus at once, joined in memory
+    drivers, student_counts = await asyncio.gather(
+        drivers_by_id(db, (bus.get("driverId") for bus in buses)),
+        students_per_bus(db, (bus.get("number") for bus in buses if bus.get("number")))
+    )
+    for bus in buses:
+        bus["driver"] = drivers.get(str(bus.get("driverId")))
+        bus["studentCount"] = student_counts.get(bus.get("number"), 0)
+    
+    # Add live position and coverage points for all buses at once
+    from ..utils.coverage import attach_coverage_points
+    await attach_coverage_points(db, buses)
     
     return {
         "count": len(buses),
@@ -297,6 +266,9 @@ async def update_bus(
             {"assignedBus": bus_number},
             {"$set": {"assignedBus": payload.newNumber}}
         )
+        await principal_cache.revoke_where(db, {"assignedBus": payload.newNumber})
+        from face_recognition_service import face_service
+        face_service.rename_bus(bus_number, payload.newNumber)
     
     # Update driver
     if payload.driverId is not None:
@@ -346,6 +318,7 @@ async def update_bus(
         {"number": bus_number},
         {"$set": update_data}
     )
+    live_fleet.update_bus(bus_number, update_data)
     
     return {
         "success": True,
@@ -386,6 +359,9 @@ async def delete_bus(
     
     # Delete the bus
     result = await db.buses.delete_one({"number": bus_number})
+    live_fleet.remove_bus(bus_number)
+    from face_cascade import face_cascade
+    face_cascade.remove_bus(bus_number)
     
     return {
         "success": True,
@@ -405,12 +381,28 @@ async def get_bus_current_location(
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access only")
     
+    from ..utils.coverage import get_route, get_coverage_points_by_route, get_coverage_points_for_bus, predict_bus_etas
+    
+    # Serve from live fleet state when available
+    state = live_fleet.get(bus_number)
+    if state is not None:
+        route = await get_route(db, state.route)
+        etas = await predict_bus_etas(db, bus_number, state.route)
+        coverage = get_coverage_points_by_route(route, state.current_stop_index or 0, etas) if route else []
+        return {
+            "busNumber": bus_number,
+            "currentLocation": state.location(),
+            "currentStopIndex": state.current_stop_index,
+            "route": state.route,
+            "coveragePoints": coverage,
+            "lastUpdated": state.timestamp
+        }
+    
     bus = await db.buses.find_one({"number": bus_number}, {"_id": 0})
     if not bus:
         raise HTTPException(status_code=404, detail="Bus not found")
     
     # Get coverage points for timeline
-    from ..utils.coverage import get_coverage_points_for_bus
     coverage = await get_coverage_points_for_bus(db, bus_number)
     
     return {
@@ -423,6 +415,47 @@ async def get_bus_current_location(
     }
 
 
+@router.get("/buses/{bus_number}/track")
+async def get_bus_track(
+    bus_number: str,
+    current_user=Depends(get_current_user),
+    db=Depends(get_db),
+    from_time: Optional[datetime] = Query(None, alias="from", description="Start time (ISO 8601, UTC); default 1 hour before 'to'"),
+    to_time: Optional[datetime] = Query(None, alias="to", description="End time (ISO 8601, UTC); default now"),
+    resolution: Optional[int] = Query(None, ge=0, description="Desired spacing between points in seconds")
+):
+    """
+    Get location history of a bus for playback
+    Served from the coarsest history tier (raw, 1m, 15m) that satisfies the resolution
+    """
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access only")
+    
+    # History is stored as naive UTC
+    from datetime import timezone
+    if to_time and to_time.tzinfo:
+        to_time = to_time.astimezone(timezone.utc).replace(tzinfo=None)
+    if from_time and from_time.tzinfo:
+        from_time = from_time.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    to_time = to_time or datetime.utcnow()
+    from_time = from_time or to_time - timedelta(hours=1)
+    if from_time >= to_time:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    
+    from ..utils.location_history import get_track
+    track = await get_track(db, bus_number, from_time, to_time, resolution)
+    
+    return {
+        "busNumber": bus_number,
+        "from": from_time,
+        "to": to_time,
+        "resolution": track["resolution"],
+        "count": len(track["points"]),
+        "points": track["points"]
+    }
+
+
 @router.get("/buses/locations/all")
 async def get_all_bus_locations(
     current_user=Depends(get_current_user),
@@ -434,6 +467,10 @@ async def get_all_bus_locations(
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access only")
     
+    # Serve from live fleet state when available
+    if live_fleet.hydrated:
+        return {"locations": live_fleet.locations()}
+    
     cursor = db.buses.find({}, {"_id": 0})
     locations = []
     
@@ -518,8 +555,15 @@ async def create_student(
     
     # Generate default password (roll number)
     default_password = payload.roll_no
-    from ..core.security import hash_password
-    hashed_password = hash_password(default_password)
+    from ..core.security import password_hasher, PasswordHasherBusy
+    try:
+        hashed_password = await password_hasher.hash(default_password)
+    except PasswordHasherBusy as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Password hashing busy, retry shortly",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     
     new_student = {
         "roll_no": payload.roll_no,
@@ -535,6 +579,9 @@ async def create_student(
     }
     
     result = await db.users.insert_one(new_student)
+    if payload.assignedBus:
+        from face_recognition_service import face_service
+        face_service.set_student_bus(payload.roll_no, payload.assignedBus)
     
     # Send email with credentials (async task)
     email_sent = False
@@ -784,6 +831,10 @@ async def update_student(
         {"roll_no": roll_no},
         {"$set": update_data}
     )
+    await principal_cache.revoke(db, student["_id"])
+    if "assignedBus" in update_data:
+        from face_recognition_service import face_service
+        face_service.set_student_bus(roll_no, update_data["assignedBus"])
     
     return {
         "success": True,
@@ -815,6 +866,9 @@ async def delete_student(
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Student not found")
+    await principal_cache.revoke(db, student["_id"])
+    from face_recognition_service import face_service
+    face_service.set_student_bus(roll_no, None)
     
     return {
         "success": True,
@@ -900,6 +954,7 @@ async def update_parent(
         {"_id": ObjectId(parent_id)},
         {"$set": update_data}
     )
+    await principal_cache.revoke(db, parent_id)
     
     return {
         "success": True,
@@ -935,6 +990,7 @@ async def delete_parent(
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Parent not found")
+    await principal_cache.revoke(db, parent_id)
     
     return {
         "success": True,
@@ -1083,34 +1139,8 @@ async def get_all_routes_detailed(
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access only")
     
-    cursor = db.routes.find({}, {"_id": 0})
-    routes = []
-    
-    async for route in cursor:
-        route_name = route.get("name")
-        
-        # Get buses on this route
-        bus_count = await db.buses.count_documents({"route": route_name})
-        
-        # Get students on this route
-        student_count = await db.users.count_documents({
-            "role": "student",
-            "route": route_name
-        })
-        
-        # Get drivers on this route
-        buses_cursor = db.buses.find({"route": route_name})
-        driver_ids = []
-        async for bus in buses_cursor:
-            if bus.get("driverId"):
-                driver_ids.append(bus.get("driverId"))
-        
-        route["busCount"] = bus_count
-        route["studentCount"] = student_count
-        route["driverCount"] = len(driver_ids)
-        route["stopCount"] = len(route.get("stops", []))
-        
-        routes.append(route)
+    # Bus, driver and student counts for every route in one aggregation per collection
+    routes = await route_summaries(db)
     
     return {
         "count": len(routes),
@@ -1180,6 +1210,8 @@ async def create_route(
     }
     
     result = await db.routes.insert_one(new_route)
+    route_stops.put(new_route)
+    coverage_maps.bump(payload.name)
     
     return {
         "success": True,
@@ -1223,6 +1255,12 @@ async def update_route(
         {"name": route_name},
         {"$set": update_data}
     )
+    route_stops.invalidate(route_name)
+    coverage_maps.bump(route_name)
+    live_fleet.reset_progress(route_name)
+    if payload.stops is not None:
+        from ..utils.eta import eta_engine
+        await eta_engine.forget_route(db, route_name)
     
     return {
         "success": True,
@@ -1269,6 +1307,8 @@ async def delete_route(
     
     # Delete the route
     result = await db.routes.delete_one({"name": route_name})
+    route_stops.invalidate(route_name)
+    coverage_maps.bump(route_name)
     
     return {
         "success": True,
@@ -1289,22 +1329,17 @@ async def get_system_statistics(
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access only")
     
-    # Counts
-    total_buses = await db.buses.count_documents({})
-    running_buses = await db.buses.count_documents({"driverId": {"$exists": True, "$ne": None}})
-    total_students = await db.users.count_documents({"role": "student"})
-    total_drivers = await db.users.count_documents({"role": "driver"})
-    assigned_drivers = await db.buses.count_documents({"driverId": {"$exists": True, "$ne": None}})
-    total_routes = await db.routes.count_documents({})
-    
-    # Pending items
-    pending_leaves = await db.leave_requests.count_documents({"status": "pending"})
-    pending_complaints = await db.complaints.count_documents({"status": "pending"})
-    
-    # Attendance today
-    from datetime import date
-    today = date.today().isoformat()
-    attendance_today = await db.attendance.count_documents({"date": today})
+    # Counts, all collections queried concurrently
+    stats = await system_stats(db)
+    total_buses = stats["buses"]["total"]
+    running_buses = stats["buses"]["running"]
+    total_students = stats["users"]["roles"].get("student", 0)
+    total_drivers = stats["users"]["roles"].get("driver", 0)
+    assigned_drivers = running_buses
+    total_routes = stats["total_routes"]
+    pending_leaves = stats["pending"]["leaves"]
+    pending_complaints = stats["pending"]["complaints"]
+    attendance_today = stats["attendance_today"]
     
     return {
         "buses": {
@@ -1329,3 +1364,35 @@ async def get_system_statistics(
             "today": attendance_today
         }
     }
+
+
+@router.get("/ingestion/status")
+async def get_ingestion_status(
+    current_user=Depends(get_current_user)
+):
+    """
+    Get MQTT location ingestion counters (queued, dropped, coalesced, flushed)
+    """
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access only")
+    
+    from mqtt_service import mqtt_service
+    return {"ingestion": mqtt_service.get_stats()}
+
+
+@router.get("/auth/status")
+async def get_auth_status(
+    current_user=Depends(get_current_user)
+):
+    """
+    Get authenticated-user cache counters (hit rate, lookup latency)
+    and bcrypt pool queue depth
+    """
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access only")
+    
+    from ..core.security import password_hasher
+    return {
+        "principals": principal_cache.get_stats(),
+        "password_hasher": password_hasher.get_stats()
+    }
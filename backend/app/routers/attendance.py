@@ -2,12 +2,12 @@ from datetime import datetime
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from ..db import get_db
-from .deps import get_current_user
+from .deps import get_current_user, get_current_principal
 
 router = APIRouter(prefix="/api", tags=["attendance"])
 
 @router.post("/attendance/board")
-async def board_bus(current_user=Depends(get_current_user), db=Depends(get_db)):
+async def board_bus(current_user=Depends(get_current_principal), db=Depends(get_db)):
     """Student marks attendance when boarding the bus"""
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Unauthorized - student only")
@@ -103,6 +103,6 @@ async def get_attendance(
 
 # Keep old endpoint for backward compatibility
 @router.post("/attendance/manual")
-async def mark_attendance_manual(current_user=Depends(get_current_user), db=Depends(get_db)):
+async def mark_attendance_manual(current_user=Depends(get_current_principal), db=Depends(get_db)):
     """Legacy endpoint - redirects to /board"""
     return await board_bus(current_user, db)
@@ -1,20 +1,38 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi import status
 from ..db import get_db
-from ..core.security import hash_password, verify_password, create_jwt
-from ..models.user import UserCreate, UserLogin, TokenResponse
+from ..core.config import get_settings
+from ..core.security import (
+    password_hasher, PasswordHasherBusy, create_jwt,
+    create_access_token, create_refresh_token, decode_jwt
+)
+from ..models.user import UserCreate, UserLogin, RefreshRequest, TokenResponse
+from ..utils.principals import principal_cache, PRINCIPAL_PROJECTION
+from .deps import get_current_principal
 from pymongo.errors import PyMongoError
 from bson import ObjectId
 
 router = APIRouter(prefix="/api", tags=["auth"])
 
+
+def hasher_busy(exc: PasswordHasherBusy) -> HTTPException:
+    """503 asking the client to retry once the bcrypt queue drains"""
+    return HTTPException(
+        status_code=503,
+        detail="Too many sign-ins in progress, retry shortly",
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @router.post("/register", status_code=status.HTTP_201_CREATED)
 async def register(payload: UserCreate, db = Depends(get_db)):
     try:
         existing = await db.users.find_one({"email": payload.email})
         if existing:
             raise HTTPException(status_code=400, detail="User already exists")
-        hashed = hash_password(payload.password)
+        try:
+            hashed = await password_hasher.hash(payload.password)
+        except PasswordHasherBusy as e:
+            raise hasher_busy(e)
         doc = payload.dict()
         doc["password"] = hashed
         res = await db.users.insert_one(doc)
@@ -25,7 +43,46 @@ async def register(payload: UserCreate, db = Depends(get_db)):
 @router.post("/login", response_model=TokenResponse)
 async def login(payload: UserLogin, db = Depends(get_db)):
     user = await db.users.find_one({"email": payload.email})
-    if not user or not verify_password(payload.password, user.get("password", "")):
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    try:
+        valid = await password_hasher.verify(payload.password, user.get("password", ""))
+    except PasswordHasherBusy as e:
+        raise hasher_busy(e)
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if payload.claims:
+        return claims_tokens(user)
     token = create_jwt(str(user["_id"]))
     return TokenResponse(token=token, role=user.get("role", "user"))
+
+def claims_tokens(user: dict) -> TokenResponse:
+    """Short-lived claims access token plus a refresh token"""
+    return TokenResponse(
+        token=create_access_token(user),
+        role=user.get("role", "user"),
+        refresh_token=create_refresh_token(user),
+        expires_in=get_settings().JWT_ACCESS_MINUTES * 60
+    )
+
+@router.post("/token/refresh", response_model=TokenResponse)
+async def refresh_token(payload: RefreshRequest, db = Depends(get_db)):
+    """
+    Exchange a refresh token for a new access/refresh pair with fresh claims.
+    Fails once the user's tokenVersion has been bumped (revoked, updated or deleted).
+    """
+    data = decode_jwt(payload.refresh_token)
+    if not data or data.get("type") != "refresh":
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+    
+    # Always read the database here: this is where revocation is enforced across workers
+    user = await db.users.find_one({"_id": ObjectId(data["user_id"])}, PRINCIPAL_PROJECTION)
+    if not user or user.get("tokenVersion", 0) != data.get("ver", 0):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return claims_tokens(user)
+
+@router.post("/logout")
+async def logout(current_user = Depends(get_current_principal), db = Depends(get_db)):
+    """Revoke every token issued to the current user"""
+    await principal_cache.revoke(db, current_user["_id"])
+    return {"message": "Logged out"}
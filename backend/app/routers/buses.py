@@ -2,8 +2,10 @@ from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from ..db import get_db
-from .deps import get_current_user
-from ..utils.coverage import get_coverage_points_for_bus
+from .deps import get_current_principal
+from ..utils.coverage import attach_coverage_points
+from ..utils.live_fleet import live_fleet
+from ..utils.location_history import append_fixes, history_document
 
 router = APIRouter(prefix="/api", tags=["buses"])
 
@@ -13,21 +15,18 @@ class BusLocationUpdate(BaseModel):
     long: float
 
 @router.get("/buses")
-async def get_buses(current_user=Depends(get_current_user), db=Depends(get_db)):
-    cursor = db.buses.find({}, {"_id": 0})
-    buses = [doc async for doc in cursor]
-    # enrich with coverage points for timeline
-    enriched = []
-    for b in buses:
-        cov = await get_coverage_points_for_bus(db, b.get("number"))
-        b_copy = {**b, "coveragePoints": cov}
-        enriched.append(b_copy)
-    return enriched
+async def get_buses(current_user=Depends(get_current_principal), db=Depends(get_db)):
+    if live_fleet.hydrated:
+        buses = live_fleet.documents()
+    else:
+        buses = [doc async for doc in db.buses.find({}, {"_id": 0})]
+    # enrich with live position and coverage points for timeline
+    return await attach_coverage_points(db, buses)
 
 @router.post("/buses/location")
 async def update_bus_location(
     payload: BusLocationUpdate,
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_principal),
     db=Depends(get_db)
 ):
     """Manually update bus GPS location (admin/driver only)"""
@@ -37,7 +36,7 @@ async def update_bus_location(
     bus_location = {
         "lat": payload.lat,
         "long": payload.long,
-        "timestamp": datetime.now()
+        "timestamp": datetime.utcnow()
     }
     
     # Calculate new currentStopIndex based on location
@@ -45,21 +44,45 @@ async def update_bus_location(
     if not bus:
         raise HTTPException(status_code=404, detail="Bus not found")
     
-    from ..utils.coverage import get_route, calculate_current_stop_index
-    route = await get_route(db, bus.get("route"))
+    from ..utils.route_stops import route_stops
+    from ..utils.eta import eta_engine
+    state = live_fleet.get(payload.busNumber)
+    progress = await route_stops.stop_progress(
+        db, bus.get("route"), bus_location,
+        state.progress if state else bus.get("routeProgress"),
+        state.elapsed(bus_location["timestamp"]) if state else None
+    )
     
     update_data = {"currentLocation": bus_location}
-    if route:
-        new_stop_index = calculate_current_stop_index(bus_location, route)
-        update_data["currentStopIndex"] = new_stop_index
+    if progress is not None:
+        update_data["currentStopIndex"], update_data["routeProgress"] = progress
+        # Learn segment times as the MQTT path does
+        eta_engine.observe(
+            payload.busNumber, bus.get("route"), route_stops.tables.get(bus.get("route")),
+            progress[0], bus_location["timestamp"], progress[1]
+        )
     
+    live_fleet.update_location(
+        payload.busNumber, bus_location, update_data.get("currentStopIndex"), update_data.get("routeProgress")
+    )
     result = await db.buses.update_one(
         {"number": payload.busNumber},
         {"$set": update_data}
     )
+    try:
+        await append_fixes(db, [history_document(payload.busNumber, bus_location)])
+    except Exception as e:
+        # The live location is already saved; history is best-effort
+        print(f"Error writing location history: {e}")
+    try:
+        await eta_engine.flush(db)
+    except Exception as e:
+        print(f"Error saving ETA statistics: {e}")
     
     # include coverage points in response for UI timeline
-    coverage = await get_coverage_points_for_bus(db, payload.busNumber)
+    bus.update(update_data)
+    await attach_coverage_points(db, [bus])
+    coverage = bus["coveragePoints"]
     
     return {
         "message": "Bus location updated",
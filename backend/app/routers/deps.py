@@ -1,25 +1,57 @@
 from fastapi import Depends, HTTPException, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from ..core.security import decode_jwt
+from ..core.security import decode_jwt, CLAIM_FIELDS
 from ..db import get_db
+from ..utils.principals import principal_cache
 from bson import ObjectId
 
 security = HTTPBearer()
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db=Depends(get_db)
-):
+def decode_bearer(credentials: HTTPAuthorizationCredentials) -> dict:
+    """Validated payload of the bearer token; refresh tokens are not accepted here"""
     token = credentials.credentials
     if not token:
         raise HTTPException(status_code=401, detail="Token missing")
     
     data = decode_jwt(token)
-    if not data:
+    if not data or data.get("type") == "refresh":
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return data
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db=Depends(get_db)
+):
+    data = decode_bearer(credentials)
     
-    user = await db.users.find_one({"_id": ObjectId(data["user_id"])})
+    # Cached for a short TTL; admin user updates invalidate it
+    user = await principal_cache.get(db, data["user_id"])
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
+    if "ver" in data and data["ver"] != user.get("tokenVersion", 0):
+        raise HTTPException(status_code=401, detail="Token revoked")
     
     return user
+
+async def get_current_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db=Depends(get_db)
+):
+    """
+    Like get_current_user, but claims tokens are authorized from their
+    signed claims alone, without reading the users collection. Returns a
+    dict with _id and the CLAIM_FIELDS, so handlers use it the same way.
+    Legacy tokens (user_id only) fall back to the user lookup.
+    """
+    data = decode_bearer(credentials)
+    if data.get("type") != "access":
+        return await get_current_user(credentials, db)
+    
+    if principal_cache.is_revoked(data["user_id"], data.get("ver", 0)):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    
+    return {
+        "_id": ObjectId(data["user_id"]),
+        "tokenVersion": data.get("ver", 0),
+        **{field: data.get(field) for field in CLAIM_FIELDS}
+    }
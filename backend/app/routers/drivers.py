@@ -6,8 +6,9 @@ from typing import Optional, List
 from fastapi import APIRouter, Depends, HTTPException, Query
 from bson import ObjectId
 from ..db import get_db
-from .deps import get_current_user
+from .deps import get_current_user, get_current_principal
 from ..models.messaging import LeaveRequest
+from ..utils.principals import principal_cache
 
 router = APIRouter(prefix="/api/drivers", tags=["drivers"])
 
@@ -96,7 +97,7 @@ async def get_assigned_students(
 
 @router.get("/me/bus-location")
 async def get_my_bus_location(
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_principal),
     db=Depends(get_db)
 ):
     """
@@ -106,15 +107,16 @@ async def get_my_bus_location(
         raise HTTPException(status_code=403, detail="Driver access only")
     
     driver_id = str(current_user.get("_id"))
-    bus = await db.buses.find_one({"driverId": driver_id}, {"_id": 0})
+    # Serve the bus from live fleet state; Mongo only for buses it does not know
+    from ..utils.live_fleet import live_fleet
+    bus = live_fleet.find_by_driver(driver_id) or await db.buses.find_one({"driverId": driver_id}, {"_id": 0})
     
     if not bus:
         raise HTTPException(status_code=404, detail="No bus assigned to driver")
     
     # Get coverage points for timeline
-    from ..utils.coverage import get_coverage_points_for_bus
-    coverage = await get_coverage_points_for_bus(db, bus.get("number"))
-    bus["coveragePoints"] = coverage
+    from ..utils.coverage import attach_coverage_points
+    await attach_coverage_points(db, [bus])
     
     return {"bus": bus}
 
@@ -418,6 +420,7 @@ async def update_driver(
         {"_id": ObjectId(driver_id)},
         {"$set": update_data}
     )
+    await principal_cache.revoke(db, driver_id)
     
     return {
         "success": True,
@@ -4,6 +4,7 @@ Handles attendance marking via face recognition
 """
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
 from fastapi import status, Request
+from fastapi.responses import JSONResponse
 from typing import List
 from datetime import datetime, date
 from bson import ObjectId
@@ -12,6 +13,24 @@ import json
 from ..db import get_db
 from .deps import get_current_user
 from face_recognition_service import face_service
+from face_rebuild import face_rebuild
+from face_inference import face_inference, face_batcher, InferenceBusy
+from face_cascade import face_cascade
+from ..models.messaging import FaceCascadeUpdate
+
+
+def busy_response(exc: InferenceBusy) -> JSONResponse:
+    """503 telling ESP32 devices to back off and retry"""
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+        content={
+            "success": False,
+            "message": "Face recognition busy, retry shortly",
+            "retry_after": exc.retry_after,
+            "led_pattern": "busy_blink"
+        }
+    )
 
 router = APIRouter(prefix="/api/face", tags=["face-recognition"])
 
@@ -43,14 +62,21 @@ async def enroll_student_faces(
     right_data = await right_image.read()
     
     # Add faces to recognition system
-    result = await face_service.add_student_faces(
-        roll_no=roll_no,
-        name=student.get("name", "Unknown"),
-        front_image=front_data,
-        left_image=left_data,
-        right_image=right_data,
-        db=db
-    )
+    try:
+        result = await face_service.add_student_faces(
+            roll_no=roll_no,
+            name=student.get("name", "Unknown"),
+            front_image=front_data,
+            left_image=left_data,
+            right_image=right_data,
+            db=db
+        )
+    except InferenceBusy as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Face recognition busy, retry shortly",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     
     if result["status"] == "success":
         return result
@@ -98,9 +124,9 @@ async def recognize_and_mark_attendance(
             print("❌ No image data or image too small")
             raise HTTPException(status_code=400, detail="No valid image provided")
         
-        # Recognize face
+        # Recognize face (inference runs on the worker pool, not the event loop)
         print("🔍 Starting face recognition...")
-        recognition_result = face_service.recognize_face(image_data)
+        recognition_result = await face_service.recognize_face_async(image_data, bus_number)
         
         print(f"Recognition result: {recognition_result.get('status')}")
         
@@ -214,6 +240,9 @@ async def recognize_and_mark_attendance(
             "led_pattern": "success_blink"  # 3 fast blinks
         }
     
+    except InferenceBusy as e:
+        print("⏳ Inference queue full - asking device to back off")
+        return busy_response(e)
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
@@ -229,7 +258,7 @@ async def face_recognition_status(
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    enrolled_students = set([entry['roll_no'] for entry in face_service.face_database])
+    enrolled_students = face_service.gallery.students()
     
     return {
         "status": "online",
@@ -238,8 +267,17 @@ async def face_recognition_status(
         "distance_metric": "cosine",
         "threshold": face_service.threshold,
         "enrolled_students": len(enrolled_students),
-        "total_encodings": len(face_service.face_database),
-        "students": list(enrolled_students)
+        "total_encodings": len(face_service.gallery),
+        "students": list(enrolled_students),
+        "store": face_service.store.get_stats(),
+        "search": {**face_service.gallery.get_stats(), **face_service.search_stats},
+        "inference": face_inference.get_stats(),
+        "batching": face_batcher.get_stats(),
+        "cascade": face_cascade.get_stats(),
+        "cache": {
+            "results": face_service.result_cache.get_stats(),
+            "embeddings": face_service.embedding_cache.get_stats()
+        }
     }
 
 @router.delete("/unenroll/{roll_no}")
@@ -261,17 +299,88 @@ async def unenroll_student(
 
 @router.post("/rebuild-database")
 async def rebuild_face_database(
+    db = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Re-encode every stored student image with the current model and
+    detector (Admin only). Runs in the background; live recognition keeps
+    using the current gallery until the new version is swapped in.
+    Track progress with GET /api/face/rebuild-status.
+    """
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if face_rebuild.running:
+        raise HTTPException(status_code=409, detail="A face database rebuild is already running")
+    
+    face_rebuild.start(face_service, db)
+    
+    return {
+        "status": "started",
+        "message": "Face database rebuild started",
+        "job": face_rebuild.get_status()
+    }
+
+@router.get("/rebuild-status")
+async def rebuild_face_database_status(
     current_user = Depends(get_current_user)
 ):
-    """Rebuild face database from stored images (Admin only)"""
+    """Progress of the face database rebuild job (Admin only)"""
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Reload database
-    face_service.load_database()
+    return {
+        "job": face_rebuild.get_status(),
+        "gallery_version": face_service.store.version,
+        "total_encodings": len(face_service.gallery)
+    }
+
+@router.get("/cascade")
+async def get_face_cascade(
+    bus_number: str = None,
+    current_user = Depends(get_current_user)
+):
+    """Detector cascade defaults, per-bus overrides and rejection counters (Admin only)"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    stats = face_cascade.get_stats()
+    if bus_number:
+        stats["effective"] = face_cascade.config(bus_number)
+    return stats
+
+@router.put("/cascade/{bus_number}")
+async def update_face_cascade(
+    bus_number: str,
+    payload: FaceCascadeUpdate,
+    db = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Override the detector cascade for one bus (Admin only)
+    Send an empty body to restore the defaults.
+    """
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    bus = await db.buses.find_one({"number": bus_number})
+    if not bus:
+        raise HTTPException(status_code=404, detail="Bus not found")
+    
+    overrides = payload.dict(exclude_none=True)
+    if overrides.get("width", 1) <= 0:
+        raise HTTPException(status_code=400, detail="width must be positive")
+    for field in ("min_face", "min_sharpness"):
+        if overrides.get(field, 0) < 0:
+            raise HTTPException(status_code=400, detail=f"{field} must not be negative")
+    
+    await face_cascade.set_bus(db, bus_number, overrides)
+    face_service.result_cache.clear()
     
     return {
-        "status": "success",
-        "message": "Face database reloaded",
-        "total_encodings": len(face_service.face_database)
+        "success": True,
+        "bus_number": bus_number,
+        "overrides": face_cascade.buses.get(bus_number, {}),
+        "effective": face_cascade.config(bus_number)
     }
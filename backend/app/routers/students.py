@@ -2,7 +2,7 @@ from datetime import datetime
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from ..db import get_db
-from .deps import get_current_user
+from .deps import get_current_user, get_current_principal
 from bson import ObjectId
 
 router = APIRouter(prefix="/api/students", tags=["students"])
@@ -36,7 +36,7 @@ async def get_my_basic_info(
 
 @router.get("/me/route")
 async def get_my_route(
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_principal),
     db=Depends(get_db)
 ):
     """
@@ -58,7 +58,7 @@ async def get_my_route(
 
 @router.get("/me/bus")
 async def get_my_bus(
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_principal),
     db=Depends(get_db)
 ):
     """
@@ -72,21 +72,22 @@ async def get_my_bus(
     if not bus_number:
         raise HTTPException(status_code=404, detail="No bus assigned")
     
-    bus = await db.buses.find_one({"number": bus_number}, {"_id": 0})
+    # Serve the bus from live fleet state; Mongo only for buses it does not know
+    from ..utils.live_fleet import live_fleet
+    bus = live_fleet.document(bus_number) or await db.buses.find_one({"number": bus_number}, {"_id": 0})
     if not bus:
         raise HTTPException(status_code=404, detail="Bus not found")
     
     # enrich bus with coverage points
-    from ..utils.coverage import get_coverage_points_for_bus
-    coverage = await get_coverage_points_for_bus(db, bus_number)
-    bus["coveragePoints"] = coverage
+    from ..utils.coverage import attach_coverage_points
+    await attach_coverage_points(db, [bus])
     
     return {"bus": bus}
 
 
 @router.get("/me/driver")
 async def get_my_driver(
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_principal),
     db=Depends(get_db)
 ):
     """
@@ -124,7 +125,7 @@ async def get_my_driver(
 
 @router.get("/me/attendance")
 async def get_my_attendance(
-    current_user=Depends(get_current_user),
+    current_user=Depends(get_current_principal),
     db=Depends(get_db)
 ):
     """
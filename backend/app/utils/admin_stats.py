@@ -0,0 +1,142 @@
+"""
+Aggregated counts for the admin dashboard, route list and statistics.
+Each collection is read with one $group pipeline that yields every
+route-level and role-level count at once, instead of a count_documents
+call per route; callers run the pipelines concurrently.
+"""
+import asyncio
+from datetime import date
+from typing import Any, Dict, Iterable, List
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+# driverId set and not None (what count_documents {"$exists": True, "$ne": None} matched)
+HAS_DRIVER = {"$gt": ["$driverId", None]}
+
+
+async def bus_counts(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """Total and running buses, plus buses and drivers per route"""
+    pipeline = [
+        {"$group": {
+            "_id": "$route",
+            "buses": {"$sum": 1},
+            "running": {"$sum": {"$cond": [HAS_DRIVER, 1, 0]}},
+            # Route driver counts skip empty driverIds, as the per-route loop did
+            "drivers": {"$sum": {"$cond": [{"$and": [HAS_DRIVER, {"$ne": ["$driverId", ""]}]}, 1, 0]}}
+        }}
+    ]
+    by_route = {group["_id"]: group async for group in db.buses.aggregate(pipeline)}
+    return {
+        "total": sum(group["buses"] for group in by_route.values()),
+        "running": sum(group["running"] for group in by_route.values()),
+        "by_route": by_route
+    }
+
+
+async def user_counts(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """Users per role, plus students per route"""
+    pipeline = [
+        {"$group": {
+            "_id": {
+                "role": "$role",
+                "route": {"$cond": [{"$eq": ["$role", "student"]}, "$route", None]}
+            },
+            "count": {"$sum": 1}
+        }}
+    ]
+    roles: Dict[str, int] = {}
+    students_by_route: Dict[str, int] = {}
+    async for group in db.users.aggregate(pipeline):
+        role, route = group["_id"].get("role"), group["_id"].get("route")
+        roles[role] = roles.get(role, 0) + group["count"]
+        if role == "student" and route is not None:
+            students_by_route[route] = group["count"]
+    return {"roles": roles, "students_by_route": students_by_route}
+
+
+async def drivers_by_id(db: AsyncIOMotorDatabase, driver_ids: Iterable[Any]) -> Dict[str, Dict[str, Any]]:
+    """name, email and phone of every driver in driver_ids, with one $in query"""
+    ids = {ObjectId(str(driver_id)) for driver_id in driver_ids if driver_id and ObjectId.is_valid(str(driver_id))}
+    if not ids:
+        return {}
+    cursor = db.users.find({"_id": {"$in": list(ids)}}, {"name": 1, "email": 1, "phone": 1})
+    return {
+        str(driver["_id"]): {"name": driver.get("name"), "email": driver.get("email"), "phone": driver.get("phone")}
+        async for driver in cursor
+    }
+
+
+async def students_per_bus(db: AsyncIOMotorDatabase, bus_numbers: Iterable[str]) -> Dict[str, int]:
+    """Students assigned to each bus in bus_numbers, with one $group"""
+    pipeline = [
+        {"$match": {"role": "student", "assignedBus": {"$in": list(bus_numbers)}}},
+        {"$group": {"_id": "$assignedBus", "count": {"$sum": 1}}}
+    ]
+    return {group["_id"]: group["count"] async for group in db.users.aggregate(pipeline)}
+
+
+async def pending_counts(db: AsyncIOMotorDatabase) -> Dict[str, int]:
+    leaves, complaints = await asyncio.gather(
+        db.leave_requests.count_documents({"status": "pending"}),
+        db.complaints.count_documents({"status": "pending"})
+    )
+    return {"leaves": leaves, "complaints": complaints}
+
+
+def summarize_routes(
+    routes: List[Dict[str, Any]],
+    buses: Dict[str, Any],
+    users: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Add busCount, studentCount, driverCount and stopCount to route documents"""
+    for route in routes:
+        route_buses = buses["by_route"].get(route.get("name"), {})
+        route["busCount"] = route_buses.get("buses", 0)
+        route["studentCount"] = users["students_by_route"].get(route.get("name"), 0)
+        route["driverCount"] = route_buses.get("drivers", 0)
+        route["stopCount"] = len(route.get("stops", []))
+    return routes
+
+
+async def route_summaries(db: AsyncIOMotorDatabase) -> List[Dict[str, Any]]:
+    """Every route with its counts (GET /api/admin/routes)"""
+    routes, buses, users = await asyncio.gather(
+        db.routes.find({}, {"_id": 0}).to_list(length=None),
+        bus_counts(db),
+        user_counts(db)
+    )
+    return summarize_routes(routes, buses, users)
+
+
+async def dashboard_stats(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """Totals and per-route counts (GET /api/admin/dashboard)"""
+    routes, buses, users, pending = await asyncio.gather(
+        db.routes.find({}, {"_id": 0}).to_list(length=None),
+        bus_counts(db),
+        user_counts(db),
+        pending_counts(db)
+    )
+    return {
+        "routes": summarize_routes(routes, buses, users),
+        "buses": buses,
+        "users": users,
+        "pending": pending
+    }
+
+
+async def system_stats(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """Everything GET /api/admin/statistics reports"""
+    buses, users, total_routes, pending, attendance_today = await asyncio.gather(
+        bus_counts(db),
+        user_counts(db),
+        db.routes.count_documents({}),
+        pending_counts(db),
+        db.attendance.count_documents({"date": date.today().isoformat()})
+    )
+    return {
+        "buses": buses,
+        "users": users,
+        "total_routes": total_routes,
+        "pending": pending,
+        "attendance_today": attendance_today
+    }
@@ -1,7 +1,11 @@
 import re
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from math import radians, sin, cos, sqrt, atan2
+from .live_fleet import live_fleet
+from .route_stops import route_stops
+from .eta import eta_engine
 
 
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -65,72 +69,154 @@ def _normalize_name(name: Optional[str]) -> str:
 
 
 async def get_route(db: AsyncIOMotorDatabase, route_name: Optional[str]) -> Optional[Dict[str, Any]]:
-    if not route_name:
-        return None
-    return await db.routes.find_one({"name": route_name})
+    """Route document from the in-memory route cache"""
+    return await route_stops.get_route(db, route_name)
 
 
-def get_coverage_points_by_route(route: Dict[str, Any], current_stop_index: Optional[int] = None) -> List[Dict[str, Any]]:
-    if not route:
-        return []
+def compile_coverage_map(route: Dict[str, Any]) -> List[Tuple[Dict[str, Any], Optional[int]]]:
+    """
+    Resolve each coverage area to its stop once (exact name match first, then
+    substring). Returns (point template, matched route stop index) pairs.
+    """
     coverage = route.get("coverageAreas", []) or []
     stops = route.get("stops", []) or []
-    points: List[Dict[str, Any]] = []
 
+    # Handle both string stops and dict stops
+    resolved = []
+    for stop in stops:
+        stop_name = stop if isinstance(stop, str) else stop.get("name", "")
+        resolved.append((
+            stop_name,
+            _normalize_name(stop_name),
+            stop.get("lat") if isinstance(stop, dict) else None,
+            stop.get("long") if isinstance(stop, dict) else None,
+        ))
+
+    compiled: List[Tuple[Dict[str, Any], Optional[int]]] = []
     for idx, cov in enumerate(coverage):
         norm_cov = _normalize_name(cov)
-        matched = None
-
-        # exact match
-        for stop in stops:
-            # Handle both string stops and dict stops
-            stop_name = stop if isinstance(stop, str) else stop.get("name", "")
-            if _normalize_name(stop_name) == norm_cov:
-                matched = {
-                    "name": stop_name,
-                    "lat": stop.get("lat") if isinstance(stop, dict) else None,
-                    "long": stop.get("long") if isinstance(stop, dict) else None,
-                    "order": idx,
-                }
-                break
-        # contains match
-        if not matched:
-            for stop in stops:
-                # Handle both string stops and dict stops
-                stop_name = stop if isinstance(stop, str) else stop.get("name", "")
-                if norm_cov in _normalize_name(stop_name):
-                    matched = {
-                        "name": stop_name,
-                        "lat": stop.get("lat") if isinstance(stop, dict) else None,
-                        "long": stop.get("long") if isinstance(stop, dict) else None,
-                        "order": idx,
-                    }
-                    break
-        if not matched:
-            matched = {"name": cov, "lat": None, "long": None, "order": idx}
-        
+        stop_idx = next((i for i, r in enumerate(resolved) if r[1] == norm_cov), None)
+        if stop_idx is None:
+            stop_idx = next((i for i, r in enumerate(resolved) if norm_cov in r[1]), None)
+
+        if stop_idx is None:
+            point = {"name": cov, "lat": None, "long": None, "order": idx}
+        else:
+            stop_name, _, lat, lon = resolved[stop_idx]
+            point = {"name": stop_name, "lat": lat, "long": lon, "order": idx}
+        compiled.append((point, stop_idx))
+    return compiled
+
+
+class CoverageMapCache:
+    """
+    LRU of compiled coverage maps keyed by route name, a version counter
+    bumped by admin route changes, and the route's updatedAt
+    """
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.maps: "OrderedDict[tuple, List[Tuple[Dict[str, Any], Optional[int]]]]" = OrderedDict()
+        self.versions: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def bump(self, route_name: str):
+        """Invalidate compiled maps of a route after create/update/delete"""
+        self.versions[route_name] = self.versions.get(route_name, 0) + 1
+
+    def get(self, route: Dict[str, Any]) -> List[Tuple[Dict[str, Any], Optional[int]]]:
+        name = route.get("name")
+        key = (name, self.versions.get(name, 0), route.get("updatedAt"))
+        compiled = self.maps.get(key)
+        if compiled is not None:
+            self.maps.move_to_end(key)
+            self.hits += 1
+            return compiled
+
+        self.misses += 1
+        compiled = compile_coverage_map(route)
+        self.maps[key] = compiled
+        if len(self.maps) > self.max_size:
+            self.maps.popitem(last=False)
+        return compiled
+
+
+coverage_maps = CoverageMapCache()
+
+
+def get_coverage_points_by_route(
+    route: Dict[str, Any],
+    current_stop_index: Optional[int] = None,
+    etas: Optional[Dict[int, Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Timeline points for a route's coverage areas.
+    etas (keyed by route stop index) adds predicted arrivals to upcoming points.
+    """
+    if not route:
+        return []
+    points: List[Dict[str, Any]] = []
+
+    for idx, (template, stop_idx) in enumerate(coverage_maps.get(route)):
+        point = dict(template)
+
         # Add status based on currentStopIndex
         if current_stop_index is not None:
             if idx < current_stop_index:
-                matched["status"] = "passed"
+                point["status"] = "passed"
             elif idx == current_stop_index:
-                matched["status"] = "current"
+                point["status"] = "current"
             else:
-                matched["status"] = "upcoming"
-        
-        points.append(matched)
+                point["status"] = "upcoming"
+                if etas and stop_idx in etas:
+                    point["eta"] = etas[stop_idx]
+
+        points.append(point)
 
     return points
 
 
+async def get_routes(db: AsyncIOMotorDatabase, route_names: List[Optional[str]]) -> Dict[str, Dict[str, Any]]:
+    """Several routes keyed by name, from the route cache (misses share one $in query)"""
+    return await route_stops.get_routes(db, route_names)
+
+
+async def attach_coverage_points(db: AsyncIOMotorDatabase, buses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Add live position and coveragePoints to already-fetched bus documents,
+    with routes read from the route cache
+    """
+    routes = await get_routes(db, [bus.get("route") for bus in buses])
+    for bus in buses:
+        live_fleet.overlay(bus)
+        route = routes.get(bus.get("route"))
+        if not bus.get("number") or not route:
+            bus["coveragePoints"] = []
+            continue
+        etas = await predict_bus_etas(db, bus["number"], route["name"])
+        bus["coveragePoints"] = get_coverage_points_by_route(route, bus.get("currentStopIndex", 0), etas)
+    return buses
+
+
 async def get_coverage_points_for_bus(db: AsyncIOMotorDatabase, bus_number: Optional[str]) -> List[Dict[str, Any]]:
     if not bus_number:
         return []
-    bus = await db.buses.find_one({"number": bus_number})
+    bus = live_fleet.document(bus_number) or await db.buses.find_one({"number": bus_number})
     if not bus:
         return []
     route = await get_route(db, bus.get("route"))
     if not route:
         return []
+    live_fleet.overlay(bus)
     current_stop_index = bus.get("currentStopIndex", 0)
-    return get_coverage_points_by_route(route, current_stop_index)
+    etas = await predict_bus_etas(db, bus_number, bus.get("route"))
+    return get_coverage_points_by_route(route, current_stop_index, etas)
+
+
+async def predict_bus_etas(db: AsyncIOMotorDatabase, bus_number: str, route_name: Optional[str]) -> Dict[int, Dict[str, Any]]:
+    """Predicted arrival at each upcoming stop, from the bus's live progress"""
+    state = live_fleet.get(bus_number)
+    if state is None or state.progress is None or not route_name:
+        return {}
+    geometry = await route_stops.get(db, route_name)
+    return eta_engine.predict(route_name, geometry, state.progress)
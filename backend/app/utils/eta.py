@@ -0,0 +1,290 @@
+"""
+ETA prediction from learned per-segment travel times.
+Segment travel times are accumulated per route, segment, weekday and hour
+as running sums, so predictions take O(stops) and learning is incremental.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from math import sqrt
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from .route_geometry import RouteGeometry
+
+DEFAULT_SPEED_MPS = 8.3          # ~30 km/h when a segment has no history
+DEFAULT_RELATIVE_STD = 0.3       # spread assumed for segments without history
+MIN_SAMPLES = 3                  # samples a bucket needs before it is trusted
+MIN_SEGMENT_SECONDS = 5          # shorter transitions are GPS noise
+MAX_SEGMENT_SECONDS = 2 * 3600   # longer ones mean the bus was parked
+STATIONARY_M = 25                # moving less than this at a stop counts as waiting there
+BAND_Z = 1.28                    # ±1.28σ ≈ 10th-90th percentile band
+
+# (count, sum, sum of squares) of segment travel seconds
+Stats = List[float]
+
+
+def _bucket(moment: datetime) -> Tuple[int, int]:
+    return moment.weekday(), moment.hour
+
+
+class ETAEngine:
+    def __init__(self):
+        # Three levels so sparse buckets fall back to broader ones
+        self.by_slot: Dict[Tuple[str, int, int, int], Stats] = {}   # route, segment, weekday, hour
+        self.by_hour: Dict[Tuple[str, int, int], Stats] = {}        # route, segment, hour
+        self.by_segment: Dict[Tuple[str, int], Stats] = {}          # route, segment
+        # bus_number -> (route, geometry position of last stop reached, time, progress)
+        self.last_stop: Dict[str, Tuple[str, int, datetime, Optional[float]]] = {}
+        self.pending: Dict[Tuple[str, int, int, int], Stats] = {}   # increments not yet persisted
+
+    # ---------- learning ----------
+
+    def _add(self, route_name: str, segment: int, moment: datetime, seconds: float, persist: bool = True):
+        weekday, hour = _bucket(moment)
+        keys = [
+            (self.by_slot, (route_name, segment, weekday, hour)),
+            (self.by_hour, (route_name, segment, hour)),
+            (self.by_segment, (route_name, segment)),
+        ]
+        if persist:
+            keys.append((self.pending, (route_name, segment, weekday, hour)))
+        for table, key in keys:
+            stats = table.setdefault(key, [0.0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] += seconds * seconds
+
+    def observe(
+        self,
+        bus_number: str,
+        route_name: Optional[str],
+        geometry: Optional[RouteGeometry],
+        stop_index: int,
+        timestamp: datetime,
+        progress: Optional[float] = None,
+        persist: bool = True,
+        last_stop: Optional[Dict[str, Tuple[str, int, datetime, Optional[float]]]] = None
+    ):
+        """
+        Feed the stop a bus has reached; learns segment times on transitions.
+        last_stop tracks each bus's previous stop (the live tracker by default;
+        history replays pass their own so they never disturb live buses).
+        """
+        if not route_name or geometry is None or not len(geometry):
+            return
+        if last_stop is None:
+            last_stop = self.last_stop
+        positions = (geometry.stop_index == stop_index).nonzero()[0]
+        if not len(positions):
+            return
+        position = int(positions[0])
+
+        previous = last_stop.get(bus_number)
+        if previous is not None and previous[0] == route_name and position == previous[1]:
+            # Time spent waiting at a stop (e.g. a layover) is not travel time
+            if progress is not None and previous[3] is not None and abs(progress - previous[3]) < STATIONARY_M:
+                last_stop[bus_number] = (route_name, position, timestamp, progress)
+            return
+        last_stop[bus_number] = (route_name, position, timestamp, progress)
+        if previous is None or previous[0] != route_name or position < previous[1]:
+            return  # first sighting, reassigned bus or a new trip
+
+        _, prev_position, prev_time, _ = previous
+        elapsed = (timestamp - prev_time).total_seconds()
+        if not MIN_SEGMENT_SECONDS <= elapsed <= MAX_SEGMENT_SECONDS:
+            return
+
+        # Skipped stops share the elapsed time in proportion to segment length
+        lengths = geometry.stop_along[prev_position + 1:position + 1] - geometry.stop_along[prev_position:position]
+        total = float(lengths.sum())
+        for offset, length in enumerate(lengths):
+            share = elapsed * (float(length) / total if total > 0 else 1 / len(lengths))
+            segment = int(geometry.stop_index[prev_position + offset])
+            self._add(route_name, segment, prev_time, share, persist)
+
+    # ---------- prediction ----------
+
+    def _segment_estimate(self, route_name: str, segment: int, length: float, moment: datetime) -> Tuple[float, float]:
+        """(mean, variance) of travel seconds for one segment"""
+        weekday, hour = _bucket(moment)
+        for table, key in (
+            (self.by_slot, (route_name, segment, weekday, hour)),
+            (self.by_hour, (route_name, segment, hour)),
+            (self.by_segment, (route_name, segment)),
+        ):
+            stats = table.get(key)
+            if stats and stats[0] >= MIN_SAMPLES:
+                count, total, squares = stats
+                mean = total / count
+                return mean, max(squares / count - mean * mean, 0.0)
+        mean = length / DEFAULT_SPEED_MPS
+        return mean, (mean * DEFAULT_RELATIVE_STD) ** 2
+
+    def predict(
+        self,
+        route_name: Optional[str],
+        geometry: Optional[RouteGeometry],
+        progress: Optional[float],
+        now: Optional[datetime] = None
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        Predicted arrival for every stop ahead of progress (meters along the route),
+        keyed by route["stops"] index
+        """
+        if not route_name or geometry is None or len(geometry) < 2 or progress is None:
+            return {}
+        now = now or datetime.utcnow()
+        along = geometry.stop_along
+
+        etas: Dict[int, Dict[str, Any]] = {}
+        mean_total = 0.0
+        var_total = 0.0
+        for position in range(len(geometry) - 1):
+            start, end = float(along[position]), float(along[position + 1])
+            if end <= progress:
+                continue
+            length = end - start
+            mean, variance = self._segment_estimate(
+                route_name, int(geometry.stop_index[position]), length, now
+            )
+            # Only the untravelled share of the current segment remains
+            remaining = (end - max(progress, start)) / length if length > 0 else 1.0
+            mean_total += mean * remaining
+            var_total += variance * remaining * remaining
+
+            spread = BAND_Z * sqrt(var_total)
+            etas[int(geometry.stop_index[position + 1])] = {
+                "arrival": now + timedelta(seconds=mean_total),
+                "seconds": round(mean_total),
+                "earliest": now + timedelta(seconds=max(mean_total - spread, 0.0)),
+                "latest": now + timedelta(seconds=mean_total + spread),
+            }
+        return etas
+
+    # ---------- persistence ----------
+
+    async def load(self, db: AsyncIOMotorDatabase):
+        """Load learned segment statistics"""
+        self.by_slot.clear()
+        self.by_hour.clear()
+        self.by_segment.clear()
+        async for doc in db.eta_segment_stats.find({}):
+            key = doc["_id"]
+            route_name, segment, weekday, hour = key["route"], key["segment"], key["weekday"], key["hour"]
+            for table, table_key in (
+                (self.by_slot, (route_name, segment, weekday, hour)),
+                (self.by_hour, (route_name, segment, hour)),
+                (self.by_segment, (route_name, segment)),
+            ):
+                stats = table.setdefault(table_key, [0.0, 0.0, 0.0])
+                stats[0] += doc["count"]
+                stats[1] += doc["sum"]
+                stats[2] += doc["sumsq"]
+        print(f"✓ Loaded ETA statistics for {len(self.by_segment)} route segments")
+
+    async def flush(self, db: AsyncIOMotorDatabase):
+        """Persist new observations as $inc updates"""
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        operations = [
+            UpdateOne(
+                {"_id": {"route": route_name, "segment": segment, "weekday": weekday, "hour": hour}},
+                {"$inc": {"count": stats[0], "sum": stats[1], "sumsq": stats[2]}},
+                upsert=True
+            )
+            for (route_name, segment, weekday, hour), stats in pending.items()
+        ]
+        await db.eta_segment_stats.bulk_write(operations, ordered=False)
+
+    async def forget_route(self, db: AsyncIOMotorDatabase, route_name: str):
+        """Drop statistics after a route's stops change"""
+        for table in (self.by_slot, self.by_hour, self.by_segment, self.pending):
+            for key in [k for k in table if k[0] == route_name]:
+                del table[key]
+        self.last_stop = {bus: v for bus, v in self.last_stop.items() if v[0] != route_name}
+        await db.eta_segment_stats.delete_many({"_id.route": route_name})
+
+    async def learn_from_history(self, db: AsyncIOMotorDatabase, route_stops, since: Optional[datetime] = None):
+        """
+        Replay the 1-minute location history through the progress model to
+        seed statistics (used when none have been stored yet). Each bus's
+        points are projected in one vectorized stop_progress_many call; only
+        the progress rules (see RouteGeometry.constrain) run point by point.
+        """
+        from .location_history import TIERS_BY_NAME
+
+        bus_routes = {
+            bus["number"]: bus.get("route")
+            async for bus in db.buses.find({}, {"_id": 0, "number": 1, "route": 1})
+            if bus.get("number")
+        }
+        query: Dict[str, Any] = {"busNumber": {"$in": list(bus_routes)}}
+        if since is not None:
+            query["timestamp"] = {"$gte": since}
+
+        cursor = db[TIERS_BY_NAME["1m"]["collection"]].find(
+            query, {"_id": 0, "busNumber": 1, "timestamp": 1, "lat": 1, "long": 1}
+        ).sort([("busNumber", 1), ("timestamp", 1)])
+        last_stop: Dict[str, Tuple[str, int, datetime, Optional[float]]] = {}
+        replayed = 0
+        points: List[Dict[str, Any]] = []
+        async for point in cursor:
+            if points and point["busNumber"] != points[0]["busNumber"]:
+                replayed += await self._replay_bus(db, route_stops, bus_routes, points, last_stop)
+                points = []
+            points.append(point)
+        if points:
+            replayed += await self._replay_bus(db, route_stops, bus_routes, points, last_stop)
+
+        await self.flush(db)
+        print(f"✓ Learned ETA statistics from {replayed} history points")
+
+    async def _replay_bus(
+        self,
+        db: AsyncIOMotorDatabase,
+        route_stops,
+        bus_routes: Dict[str, Optional[str]],
+        points: List[Dict[str, Any]],
+        last_stop: Dict[str, Tuple[str, int, datetime, Optional[float]]]
+    ) -> int:
+        """Replay one bus's time-ordered history points; returns how many were used"""
+        bus_number = points[0]["busNumber"]
+        route_name = bus_routes.get(bus_number)
+        geometry = await route_stops.get(db, route_name)
+        if geometry is None:
+            return 0
+        # Raw projections (off-route fixes come back as None)
+        projected = await route_stops.stop_progress_many(
+            db, [(route_name, point.get("lat"), point.get("long"), None, None) for point in points]
+        )
+
+        replayed = 0
+        previous, previous_at = np.nan, None
+        for point, result in zip(points, projected):
+            if result is None:
+                continue
+            elapsed = (point["timestamp"] - previous_at).total_seconds() if previous_at else np.nan
+            along, accepted = geometry.constrain(np.array([result[1]]), np.array([previous]), np.array([elapsed]))
+            if not accepted[0]:
+                continue
+            previous, previous_at = float(along[0]), point["timestamp"]
+            stop_index = int(geometry.stops_reached(along)[0])
+            self.observe(
+                bus_number, route_name, geometry, stop_index, point["timestamp"], previous, last_stop=last_stop
+            )
+            replayed += 1
+        await asyncio.sleep(0)  # let requests run between buses
+        return replayed
+
+    async def learn_in_background(self, db: AsyncIOMotorDatabase, route_stops, days: int):
+        """learn_from_history over the last days, logging instead of raising (startup task)"""
+        try:
+            await self.learn_from_history(db, route_stops, since=datetime.utcnow() - timedelta(days=days))
+        except Exception as e:
+            print(f"✗ Learning ETA statistics from history failed: {e}")
+
+
+# Global ETA engine
+eta_engine = ETAEngine()
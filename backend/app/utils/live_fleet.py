@@ -0,0 +1,196 @@
+"""
+Process-local live fleet state.
+Holds every bus document and its newest known position so polling reads are
+served from memory; MongoDB is the durable copy written behind it.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+
+class BusState:
+    """Latest live state of one bus"""
+    __slots__ = (
+        "doc", "route", "lat", "long", "timestamp", "device_id", "current_stop_index", "progress", "progress_at"
+    )
+
+    def __init__(self, doc: Dict[str, Any]):
+        self.doc = doc  # bus document (without _id) as last written by the admin endpoints
+        self.route: Optional[str] = doc.get("route")
+        self.lat: Optional[float] = None
+        self.long: Optional[float] = None
+        self.timestamp: Optional[datetime] = None
+        self.device_id: Optional[str] = None
+        self.current_stop_index: Optional[int] = None
+        self.progress: Optional[float] = None  # meters along the route polyline
+        self.progress_at: Optional[datetime] = None  # time of the fix that set progress
+
+    def elapsed(self, timestamp: datetime) -> Optional[float]:
+        """Seconds between the fix that set progress and timestamp (None if unknown)"""
+        if self.progress is None or self.progress_at is None:
+            return None
+        return (timestamp - self.progress_at).total_seconds()
+
+    def location(self) -> Optional[Dict[str, Any]]:
+        if self.lat is None or self.long is None:
+            return None
+        location = {"lat": self.lat, "long": self.long, "timestamp": self.timestamp}
+        if self.device_id:
+            location["device_id"] = self.device_id
+        return location
+
+
+class LiveFleetStore:
+    def __init__(self):
+        self.buses: Dict[str, BusState] = {}
+        self.hydrated = False
+
+    async def hydrate(self, db: AsyncIOMotorDatabase):
+        """Load every bus document and its last persisted position from MongoDB"""
+        buses: Dict[str, BusState] = {}
+        async for bus in db.buses.find({}, {"_id": 0}):
+            if not bus.get("number"):
+                continue
+            state = BusState(bus)
+            loc = bus.get("currentLocation") or {}
+            state.lat = loc.get("lat")
+            state.long = loc.get("long")
+            state.timestamp = loc.get("timestamp")
+            state.device_id = loc.get("device_id")
+            state.current_stop_index = bus.get("currentStopIndex")
+            state.progress = bus.get("routeProgress")
+            state.progress_at = state.timestamp if state.progress is not None else None
+            buses[bus["number"]] = state
+        self.buses = buses
+        self.hydrated = True
+        print(f"✓ Live fleet state loaded for {len(buses)} buses")
+
+    # ---------- writes ----------
+
+    def update_location(
+        self,
+        bus_number: str,
+        location_data: Dict[str, Any],
+        current_stop_index: Optional[int] = None,
+        progress: Optional[float] = None
+    ) -> bool:
+        """Record a new fix; returns False for buses the store does not know"""
+        state = self.buses.get(bus_number)
+        if state is None:
+            return False
+        state.lat = location_data.get("lat")
+        state.long = location_data.get("long")
+        state.timestamp = location_data.get("timestamp")
+        state.device_id = location_data.get("device_id")
+        if current_stop_index is not None:
+            state.current_stop_index = current_stop_index
+        if progress is not None:
+            state.progress = progress
+            state.progress_at = state.timestamp
+        return True
+
+    def set_stop_index(
+        self,
+        bus_number: str,
+        current_stop_index: int,
+        timestamp: Optional[datetime] = None,
+        progress: Optional[float] = None
+    ):
+        """Record stop progress computed for the fix taken at timestamp"""
+        state = self.buses.get(bus_number)
+        if state is None:
+            return
+        # A newer fix may have arrived while progress was being computed
+        if timestamp is not None and state.timestamp != timestamp:
+            return
+        state.current_stop_index = current_stop_index
+        if progress is not None:
+            state.progress = progress
+            state.progress_at = state.timestamp
+
+    def upsert_bus(self, bus: Dict[str, Any]):
+        """Track a newly created bus"""
+        state = BusState({key: value for key, value in bus.items() if key != "_id"})
+        loc = bus.get("currentLocation") or {}
+        state.lat = loc.get("lat")
+        state.long = loc.get("long")
+        state.timestamp = loc.get("timestamp")
+        state.current_stop_index = bus.get("currentStopIndex")
+        self.buses[bus["number"]] = state
+
+    def update_bus(self, bus_number: str, update_data: Dict[str, Any]):
+        """Mirror an admin $set (rename, driver or route reassignment)"""
+        state = self.buses.get(bus_number)
+        if state is None:
+            return
+        state.doc.update(update_data)
+        if "route" in update_data and update_data["route"] != state.route:
+            state.route = update_data["route"]
+            state.progress = None
+        new_number = update_data.get("number")
+        if new_number and new_number != bus_number:
+            self.buses[new_number] = self.buses.pop(bus_number)
+
+    def reset_progress(self, route_name: str):
+        """Forget along-route progress after a route's stops change"""
+        for state in self.buses.values():
+            if state.route == route_name:
+                state.progress = None
+
+    def remove_bus(self, bus_number: str):
+        self.buses.pop(bus_number, None)
+
+    # ---------- reads ----------
+
+    def get(self, bus_number: Optional[str]) -> Optional[BusState]:
+        if not bus_number:
+            return None
+        return self.buses.get(bus_number)
+
+    def document(self, bus_number: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Copy of a bus document with live location fields (None if unknown)"""
+        state = self.get(bus_number)
+        if state is None:
+            return None
+        return self.overlay(dict(state.doc))
+
+    def documents(self) -> List[Dict[str, Any]]:
+        """Copies of every bus document with live location fields"""
+        return [self.overlay(dict(state.doc)) for state in self.buses.values()]
+
+    def find_by_driver(self, driver_id: str) -> Optional[Dict[str, Any]]:
+        """Copy of the bus assigned to a driver (None if none is known)"""
+        for state in self.buses.values():
+            if state.doc.get("driverId") == driver_id:
+                return self.overlay(dict(state.doc))
+        return None
+
+    def overlay(self, bus: Dict[str, Any]) -> Dict[str, Any]:
+        """Replace a bus document's location fields with the live values"""
+        state = self.get(bus.get("number"))
+        if state is None:
+            return bus
+        location = state.location()
+        if location is not None:
+            bus["currentLocation"] = location
+        if state.current_stop_index is not None:
+            bus["currentStopIndex"] = state.current_stop_index
+        return bus
+
+    def locations(self) -> List[Dict[str, Any]]:
+        """Current location summary for every bus"""
+        result = []
+        for bus_number, state in self.buses.items():
+            location = state.location()
+            result.append({
+                "busNumber": bus_number,
+                "route": state.route,
+                "currentLocation": location,
+                "currentStopIndex": state.current_stop_index,
+                "lastUpdated": state.timestamp
+            })
+        return result
+
+
+# Global live fleet instance
+live_fleet = LiveFleetStore()
@@ -0,0 +1,217 @@
+"""
+Bus location history stored in MongoDB time-series collections.
+Raw GPS fixes are appended from the ingestion path and rolled up into
+1-minute and 15-minute tiers, each with its own TTL retention.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure
+from ..core.config import get_settings
+
+# Tiers from finest to coarsest: name, collection, bucket seconds, source tier
+HISTORY_TIERS = [
+    {"name": "raw", "collection": "bus_locations", "step": 0, "granularity": "seconds", "source": None},
+    {"name": "1m", "collection": "bus_locations_1m", "step": 60, "granularity": "minutes", "source": "raw"},
+    {"name": "15m", "collection": "bus_locations_15m", "step": 900, "granularity": "hours", "source": "1m"},
+]
+TIERS_BY_NAME = {tier["name"]: tier for tier in HISTORY_TIERS}
+
+# Aim for roughly this many points when the caller does not ask for a resolution
+DEFAULT_TRACK_POINTS = 1000
+
+
+def tier_retention(tier_name: str) -> timedelta:
+    settings = get_settings()
+    days = {
+        "raw": settings.HISTORY_RAW_RETENTION_DAYS,
+        "1m": settings.HISTORY_1M_RETENTION_DAYS,
+        "15m": settings.HISTORY_15M_RETENTION_DAYS,
+    }[tier_name]
+    return timedelta(days=days)
+
+
+async def ensure_history_collections(db: AsyncIOMotorDatabase):
+    """Create the time-series collections (idempotent) and apply TTLs"""
+    existing = set(await db.list_collection_names())
+    for tier in HISTORY_TIERS:
+        name = tier["collection"]
+        ttl = int(tier_retention(tier["name"]).total_seconds())
+        if name not in existing:
+            try:
+                await db.create_collection(
+                    name,
+                    timeseries={
+                        "timeField": "timestamp",
+                        "metaField": "busNumber",
+                        "granularity": tier["granularity"],
+                    },
+                    expireAfterSeconds=ttl,
+                )
+                continue
+            except OperationFailure as e:
+                # Server without time-series support: plain collection + TTL index
+                print(f"⚠ Time-series collections unavailable ({e}); using TTL index for {name}")
+                await db[name].create_index("timestamp", expireAfterSeconds=ttl)
+                await db[name].create_index([("busNumber", 1), ("timestamp", 1)])
+                continue
+        try:
+            await db.command("collMod", name, expireAfterSeconds=ttl)
+        except OperationFailure:
+            pass
+
+
+def history_document(bus_number: str, location_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a location fix for the raw history tier"""
+    doc = {
+        "busNumber": bus_number,
+        "timestamp": location_data["timestamp"],
+        "lat": location_data["lat"],
+        "long": location_data["long"],
+    }
+    if location_data.get("device_id"):
+        doc["device_id"] = location_data["device_id"]
+    return doc
+
+
+async def append_fixes(db: AsyncIOMotorDatabase, docs: List[Dict[str, Any]]):
+    """Bulk insert raw fixes"""
+    if docs:
+        await db[TIERS_BY_NAME["raw"]["collection"]].insert_many(docs, ordered=False)
+
+
+def choose_tier(start: datetime, end: datetime, resolution: Optional[int], now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Pick the coarsest tier whose bucket size is no larger than the requested
+    resolution (seconds) and whose retention still covers the start time.
+    """
+    now = now or datetime.utcnow()
+    if resolution is None:
+        resolution = int((end - start).total_seconds() / DEFAULT_TRACK_POINTS)
+
+    chosen = HISTORY_TIERS[0]
+    for tier in HISTORY_TIERS:
+        if tier["step"] <= resolution:
+            chosen = tier
+
+    # Fall back to coarser tiers if the finer one has already expired the range
+    index = HISTORY_TIERS.index(chosen)
+    while index < len(HISTORY_TIERS) - 1 and start < now - tier_retention(HISTORY_TIERS[index]["name"]):
+        index += 1
+    return HISTORY_TIERS[index]
+
+
+async def get_track(
+    db: AsyncIOMotorDatabase,
+    bus_number: str,
+    start: datetime,
+    end: datetime,
+    resolution: Optional[int] = None
+) -> Dict[str, Any]:
+    tier = choose_tier(start, end, resolution)
+    cursor = db[tier["collection"]].find(
+        {"busNumber": bus_number, "timestamp": {"$gte": start, "$lte": end}},
+        {"_id": 0, "busNumber": 0}
+    ).sort("timestamp", 1)
+    points = [doc async for doc in cursor]
+    return {"resolution": tier["name"], "points": points}
+
+
+def _rollup_pipeline(start: datetime, end: datetime, step: int) -> List[Dict[str, Any]]:
+    """Group fixes into fixed buckets; counts weight the averages of rolled-up tiers"""
+    weight = {"$ifNull": ["$count", 1]}
+    return [
+        {"$match": {"timestamp": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {
+                "busNumber": "$busNumber",
+                "timestamp": {"$dateTrunc": {"date": "$timestamp", "unit": "second", "binSize": step}},
+            },
+            "latSum": {"$sum": {"$multiply": ["$lat", weight]}},
+            "longSum": {"$sum": {"$multiply": ["$long", weight]}},
+            "count": {"$sum": weight},
+        }},
+        {"$project": {
+            "_id": 0,
+            "busNumber": "$_id.busNumber",
+            "timestamp": "$_id.timestamp",
+            "lat": {"$divide": ["$latSum", "$count"]},
+            "long": {"$divide": ["$longSum", "$count"]},
+            "count": 1,
+        }},
+    ]
+
+
+def _floor(moment: datetime, step: int) -> datetime:
+    epoch = datetime(1970, 1, 1)
+    seconds = int((moment - epoch).total_seconds())
+    return epoch + timedelta(seconds=seconds - seconds % step)
+
+
+class HistoryDownsampler:
+    """Background task rolling raw fixes into the 1m and 15m tiers"""
+
+    def __init__(self, interval: float = 60.0):
+        self.interval = interval
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def _watermark(self, tier: Dict[str, Any]) -> Optional[datetime]:
+        state = await self.db.history_rollups.find_one({"_id": tier["name"]})
+        if state:
+            return state["until"]
+        # First run: start from the oldest fix still in the source tier
+        source = TIERS_BY_NAME[tier["source"]]
+        oldest = await self.db[source["collection"]].find_one({}, sort=[("timestamp", 1)])
+        return _floor(oldest["timestamp"], tier["step"]) if oldest else None
+
+    async def rollup(self, tier: Dict[str, Any], limit: datetime) -> Optional[datetime]:
+        """Roll closed buckets before limit into tier; returns the new watermark"""
+        start = await self._watermark(tier)
+        end = _floor(limit, tier["step"])
+        if start is None or end <= start:
+            return start
+
+        cursor = self.db[TIERS_BY_NAME[tier["source"]]["collection"]].aggregate(
+            _rollup_pipeline(start, end, tier["step"])
+        )
+        docs = [doc async for doc in cursor]
+        if docs:
+            await self.db[tier["collection"]].insert_many(docs, ordered=False)
+        await self.db.history_rollups.update_one(
+            {"_id": tier["name"]}, {"$set": {"until": end}}, upsert=True
+        )
+        return end
+
+    async def run_once(self):
+        limit = datetime.utcnow()
+        for tier in HISTORY_TIERS[1:]:
+            # A tier can only roll up what its source tier has already closed
+            limit = await self.rollup(tier, limit) or limit
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Error downsampling location history: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.task = asyncio.get_running_loop().create_task(self._loop())
+        print("✓ Location history downsampler started")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+# Global downsampler instance
+history_downsampler = HistoryDownsampler()
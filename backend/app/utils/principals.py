@@ -0,0 +1,123 @@
+"""
+In-memory cache of authenticated principals used by get_current_user.
+Holds the user document (without the password hash) per user id for a
+short TTL, so polling endpoints do not hit MongoDB on every request.
+Admin endpoints that change or delete users revoke them: the cached
+document is dropped and the user's tokenVersion is bumped, so claims
+tokens signed with the old version stop being accepted.
+"""
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+# Fields never cached or handed to route handlers
+PRINCIPAL_PROJECTION = {"password": 0}
+
+
+class PrincipalCache:
+    def __init__(self):
+        self.entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Lowest token version still accepted, per user revoked by this process
+        self.versions: Dict[str, float] = {}
+        self.max_size: Optional[int] = None
+        self.ttl = 30.0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "hit_seconds": 0.0,
+            "miss_seconds": 0.0
+        }
+
+    def _configure(self):
+        from ..core.config import get_settings
+        settings = get_settings()
+        self.max_size = max(0, settings.PRINCIPAL_CACHE_SIZE)
+        self.ttl = max(0.0, settings.PRINCIPAL_CACHE_TTL_SECONDS)
+
+    async def get(self, db: AsyncIOMotorDatabase, user_id: str) -> Optional[Dict[str, Any]]:
+        """The user document for user_id, from the cache or MongoDB (None if it does not exist)"""
+        if self.max_size is None:
+            self._configure()
+        started = time.perf_counter()
+
+        entry = self.entries.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+            self.entries.move_to_end(user_id)
+            self.stats["hits"] += 1
+            self.stats["hit_seconds"] += time.perf_counter() - started
+            return dict(entry[1])
+
+        user = await db.users.find_one({"_id": ObjectId(user_id)}, PRINCIPAL_PROJECTION)
+        if user is not None and self.max_size and self.ttl:
+            self.entries[user_id] = (time.monotonic(), user)
+            self.entries.move_to_end(user_id)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        elif entry is not None:
+            del self.entries[user_id]
+        self.stats["misses"] += 1
+        self.stats["miss_seconds"] += time.perf_counter() - started
+        return dict(user) if user is not None else None
+
+    def invalidate(self, user_id: Optional[Any] = None):
+        """Drop one user's entry, or all of them (e.g. after a bulk update)"""
+        self.stats["invalidations"] += 1
+        if user_id is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(str(user_id), None)
+
+    async def revoke(self, db: AsyncIOMotorDatabase, user_id: Any):
+        """
+        Bump a user's tokenVersion and drop the cached document. Deleted
+        users (no document left) are revoked for good in this process.
+        """
+        user = await db.users.find_one_and_update(
+            {"_id": ObjectId(user_id)},
+            {"$inc": {"tokenVersion": 1}},
+            projection={"tokenVersion": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        self.versions[str(user_id)] = user["tokenVersion"] if user else math.inf
+        self.invalidate(user_id)
+
+    async def revoke_where(self, db: AsyncIOMotorDatabase, query: Dict[str, Any]):
+        """revoke() for every user matching query (e.g. all riders of a renamed bus)"""
+        await db.users.update_many(query, {"$inc": {"tokenVersion": 1}})
+        async for user in db.users.find(query, {"_id": 1, "tokenVersion": 1}):
+            self.versions[str(user["_id"])] = user["tokenVersion"]
+        self.invalidate()
+
+    def is_revoked(self, user_id: str, version: int) -> bool:
+        """
+        True if this process revoked the user after the token was signed.
+        Other workers pick the revocation up when the access token expires
+        and its refresh is checked against the database.
+        """
+        return version < self.versions.get(user_id, 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits, misses = self.stats["hits"], self.stats["misses"]
+        lookups = hits + misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "invalidations": self.stats["invalidations"],
+            "revoked_users": len(self.versions),
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "avg_hit_ms": round(self.stats["hit_seconds"] * 1000 / hits, 3) if hits else None,
+            "avg_miss_ms": round(self.stats["miss_seconds"] * 1000 / misses, 3) if misses else None
+        }
+
+
+# Global principal cache
+principal_cache = PrincipalCache()
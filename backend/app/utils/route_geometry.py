@@ -0,0 +1,162 @@
+"""
+NumPy route geometry: stops and segments of a route stored as arrays so
+distances and along-route progress are computed for many buses at once.
+"""
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+AT_STOP_RADIUS_M = 500.0     # within this distance the bus is "at" the stop
+TRIP_RESET_M = 1000.0        # progress may only go backwards by a new trip from the first stop
+OFF_ROUTE_M = 1000.0         # fixes further than this from the route polyline are rejected
+MAX_SPEED_MPS = 30.0         # ~108 km/h; progress may not jump further ahead than this allows
+JUMP_SLACK_M = AT_STOP_RADIUS_M  # GPS noise allowed on top of MAX_SPEED_MPS * elapsed
+
+
+def haversine_matrix(lats: np.ndarray, lons: np.ndarray, stop_lats: np.ndarray, stop_lons: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distances in meters between every fix and every stop.
+    All inputs in radians; returns shape (len(lats), len(stop_lats)).
+    """
+    lat = lats[:, None]
+    lon = lons[:, None]
+    a = (
+        np.sin((stop_lats[None, :] - lat) / 2) ** 2
+        + np.cos(lat) * np.cos(stop_lats)[None, :] * np.sin((stop_lons[None, :] - lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class RouteGeometry:
+    """Stop coordinates and polyline segments of one route"""
+    __slots__ = (
+        "route_name", "stop_index", "stop_lat", "stop_lon",
+        "origin", "xy", "seg_start", "seg_vec", "seg_len2", "stop_along", "length"
+    )
+
+    def __init__(self, route: Dict[str, Any]):
+        self.route_name = route.get("name")
+        index, lats, lons = [], [], []
+        for idx, stop in enumerate(route.get("stops", []) or []):
+            if not isinstance(stop, dict) or stop.get("lat") is None or stop.get("long") is None:
+                continue
+            index.append(idx)
+            lats.append(stop["lat"])
+            lons.append(stop["long"])
+
+        # Original stop positions, so results map back onto route["stops"]
+        self.stop_index = np.asarray(index, dtype=np.int32)
+        self.stop_lat = np.radians(np.asarray(lats, dtype=np.float64))
+        self.stop_lon = np.radians(np.asarray(lons, dtype=np.float64))
+
+        # Local equirectangular plane around the route for segment projection
+        self.origin = (
+            (float(self.stop_lat.mean()), float(self.stop_lon.mean())) if index else (0.0, 0.0)
+        )
+        self.xy = self._to_plane(self.stop_lat, self.stop_lon)
+        self.seg_start = self.xy[:-1]
+        self.seg_vec = self.xy[1:] - self.xy[:-1]
+        self.seg_len2 = np.maximum((self.seg_vec ** 2).sum(axis=1), 1e-9)
+        seg_len = np.sqrt((self.seg_vec ** 2).sum(axis=1))
+        self.stop_along = np.concatenate(([0.0], np.cumsum(seg_len)))
+        self.length = float(self.stop_along[-1]) if index else 0.0
+
+    def __len__(self):
+        return len(self.stop_index)
+
+    def _to_plane(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        lat0, lon0 = self.origin
+        x = EARTH_RADIUS_M * (lon - lon0) * np.cos(lat0)
+        y = EARTH_RADIUS_M * (lat - lat0)
+        return np.stack([x, y], axis=-1)
+
+    def nearest_stops(self, lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest stop (route["stops"] index) and its distance for every fix, in degrees in"""
+        distances = haversine_matrix(np.radians(lats), np.radians(lons), self.stop_lat, self.stop_lon)
+        nearest = distances.argmin(axis=1)
+        return self.stop_index[nearest], distances[np.arange(len(nearest)), nearest]
+
+    def nearest_stop_indices(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """Vectorized coverage.calculate_current_stop_index (direction-unaware)"""
+        if not len(self):
+            return np.zeros(len(lats), dtype=np.int32)
+        distances = haversine_matrix(np.radians(lats), np.radians(lons), self.stop_lat, self.stop_lon)
+        nearest = distances.argmin(axis=1)
+        at_stop = distances[np.arange(len(nearest)), nearest] < AT_STOP_RADIUS_M
+        return np.where(at_stop, self.stop_index[nearest], np.maximum(self.stop_index[nearest] - 1, 0))
+
+    def project(self, lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Project fixes onto the route polyline.
+        Returns along-route distance (m) and cross-track distance (m) per fix.
+        """
+        points = self._to_plane(np.radians(lats), np.radians(lons))
+        if len(self) < 2:
+            cross = np.sqrt(((points - self.xy[:1]) ** 2).sum(axis=1)) if len(self) else np.zeros(len(lats))
+            return np.zeros(len(lats)), cross
+
+        # (fixes, segments) projection parameter clamped onto each segment
+        rel = points[:, None, :] - self.seg_start[None, :, :]
+        t = np.clip((rel * self.seg_vec[None, :, :]).sum(axis=2) / self.seg_len2[None, :], 0.0, 1.0)
+        closest = self.seg_start[None, :, :] + t[:, :, None] * self.seg_vec[None, :, :]
+        cross2 = ((points[:, None, :] - closest) ** 2).sum(axis=2)
+
+        best = cross2.argmin(axis=1)
+        rows = np.arange(len(best))
+        seg_len = self.stop_along[1:] - self.stop_along[:-1]
+        along = self.stop_along[best] + t[rows, best] * seg_len[best]
+        return along, np.sqrt(cross2[rows, best])
+
+    def constrain(
+        self,
+        along: np.ndarray,
+        previous: np.ndarray,
+        elapsed: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Apply the progress rules to projected positions: progress never moves
+        backwards except for a new trip starting at the first stop, and a
+        jump further ahead than MAX_SPEED_MPS allows in elapsed seconds is a
+        glitch. previous / elapsed are NaN when unknown. Returns progress and
+        an accepted mask; rejected fixes keep their previous progress.
+        """
+        along = np.asarray(along, dtype=np.float64)
+        previous = np.asarray(previous, dtype=np.float64)
+        known = ~np.isnan(previous)
+        new_trip = (previous - along > TRIP_RESET_M) & (along < AT_STOP_RADIUS_M)
+        accepted = np.ones(along.shape, dtype=bool)
+        if elapsed is not None:
+            limit = np.asarray(elapsed, dtype=np.float64) * MAX_SPEED_MPS + JUMP_SLACK_M
+            accepted = ~(known & ~new_trip & (along - previous > limit))
+        along = np.where(known & ~new_trip, np.maximum(along, np.nan_to_num(previous)), along)
+        return np.where(accepted, along, previous), accepted
+
+    def stops_reached(self, along: np.ndarray) -> np.ndarray:
+        """Last stop reached (route["stops"] index), once within AT_STOP_RADIUS_M of it"""
+        if not len(self):
+            return np.zeros(len(along), dtype=np.int32)
+        reached = np.searchsorted(self.stop_along, along + AT_STOP_RADIUS_M, side="right") - 1
+        reached = np.clip(reached, 0, len(self) - 1)
+        return self.stop_index[reached]
+
+    def progress(
+        self,
+        lats: np.ndarray,
+        lons: np.ndarray,
+        previous: Optional[np.ndarray] = None,
+        elapsed: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Monotonic along-route progress, current stop index and an accepted
+        mask for every fix. previous holds each bus's last progress and
+        elapsed the seconds since it was computed (NaN when unknown). Fixes
+        more than OFF_ROUTE_M from the route, or implausibly far ahead (see
+        constrain), are not accepted and must not update the bus.
+        """
+        along, cross = self.project(lats, lons)
+        # Single-stop routes have no polyline to measure against
+        accepted = cross <= OFF_ROUTE_M if len(self) >= 2 else np.ones(len(along), dtype=bool)
+        if previous is not None:
+            along, plausible = self.constrain(along, previous, elapsed)
+            accepted &= plausible
+        return along, self.stops_reached(along), accepted
@@ -0,0 +1,122 @@
+"""
+In-memory cache of route documents and per-route geometry used to compute
+currentStopIndex on the location ingestion path and to serve route data to
+polling endpoints. Geometry is built once per route and invalidated when
+admin route endpoints change the stops.
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from .route_geometry import RouteGeometry
+
+# (route name, lat, long, previous progress or None, seconds since it or None)
+ProgressRequest = Tuple[Optional[str], float, float, Optional[float], Optional[float]]
+
+
+class RouteStopCache:
+    def __init__(self):
+        self.routes: Dict[str, Optional[Dict[str, Any]]] = {}   # None caches a missing route
+        self.tables: Dict[str, Optional[RouteGeometry]] = {}
+
+    def _store(self, route_name: str, route: Optional[Dict[str, Any]]):
+        self.routes[route_name] = route
+        self.tables[route_name] = RouteGeometry(route) if route else None
+
+    async def load_all(self, db: AsyncIOMotorDatabase):
+        """Load every route document and build its geometry up front"""
+        self.routes, self.tables = {}, {}
+        async for route in db.routes.find({}, {"_id": 0}):
+            if route.get("name"):
+                self._store(route["name"], route)
+
+    async def get_route(self, db: AsyncIOMotorDatabase, route_name: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Route document (without _id), read from MongoDB only on a cache miss"""
+        if not route_name:
+            return None
+        if route_name not in self.routes:
+            self._store(route_name, await db.routes.find_one({"name": route_name}, {"_id": 0}))
+        return self.routes[route_name]
+
+    async def get_routes(self, db: AsyncIOMotorDatabase, route_names: List[Optional[str]]) -> Dict[str, Dict[str, Any]]:
+        """Several route documents keyed by name; misses are fetched with one $in query"""
+        names = {name for name in route_names if name}
+        missing = [name for name in names if name not in self.routes]
+        if missing:
+            found = {route["name"]: route async for route in db.routes.find({"name": {"$in": missing}}, {"_id": 0})}
+            for name in missing:
+                self._store(name, found.get(name))
+        return {name: self.routes[name] for name in names if self.routes[name] is not None}
+
+    async def get(self, db: AsyncIOMotorDatabase, route_name: Optional[str]) -> Optional[RouteGeometry]:
+        if not route_name:
+            return None
+        if route_name not in self.tables:
+            await self.get_route(db, route_name)
+        return self.tables.get(route_name)
+
+    def put(self, route: Dict[str, Any]):
+        self._store(route["name"], {key: value for key, value in route.items() if key != "_id"})
+
+    def invalidate(self, route_name: Optional[str] = None):
+        """Drop one route's document and geometry, or all of them"""
+        if route_name is None:
+            self.routes.clear()
+            self.tables.clear()
+        else:
+            self.routes.pop(route_name, None)
+            self.tables.pop(route_name, None)
+
+    async def stop_progress_many(
+        self,
+        db: AsyncIOMotorDatabase,
+        requests: List[ProgressRequest]
+    ) -> List[Optional[Tuple[int, float]]]:
+        """
+        (currentStopIndex, along-route progress in meters) for every request,
+        computed with one vectorized call per route; None if the route is unknown
+        or the fix was rejected (off the route, or an implausible jump ahead)
+        """
+        results: List[Optional[Tuple[int, float]]] = [None] * len(requests)
+        by_route: Dict[str, List[int]] = defaultdict(list)
+        for i, (route_name, lat, lon, _, _) in enumerate(requests):
+            if route_name and lat is not None and lon is not None:
+                by_route[route_name].append(i)
+
+        for route_name, positions in by_route.items():
+            geometry = await self.get(db, route_name)
+            if geometry is None:
+                continue
+            lats = np.array([requests[i][1] for i in positions], dtype=np.float64)
+            lons = np.array([requests[i][2] for i in positions], dtype=np.float64)
+            previous = np.array(
+                [np.nan if requests[i][3] is None else requests[i][3] for i in positions],
+                dtype=np.float64
+            )
+            elapsed = np.array(
+                [np.nan if requests[i][4] is None else requests[i][4] for i in positions],
+                dtype=np.float64
+            )
+            along, stop_index, accepted = geometry.progress(lats, lons, previous, elapsed)
+            for j, i in enumerate(positions):
+                if accepted[j]:
+                    results[i] = (int(stop_index[j]), float(along[j]))
+        return results
+
+    async def stop_progress(
+        self,
+        db: AsyncIOMotorDatabase,
+        route_name: Optional[str],
+        location: Dict[str, Any],
+        previous: Optional[float] = None,
+        elapsed: Optional[float] = None
+    ) -> Optional[Tuple[int, float]]:
+        """(currentStopIndex, progress) for a single fix"""
+        results = await self.stop_progress_many(
+            db, [(route_name, location.get("lat"), location.get("long"), previous, elapsed)]
+        )
+        return results[0]
+
+
+# Global route stop cache
+route_stops = RouteStopCache()
@@ -0,0 +1,213 @@
+"""
+Benchmark: per-route count_documents loops vs aggregated admin statistics
+Seeds a scratch database (200 routes, 400 buses, 20k students), then
+times the previous dashboard / routes / statistics implementations
+against app.utils.admin_stats and checks both return the same numbers.
+
+Needs a MongoDB server: uses MONGO_URI from the environment / .env and
+the database MONGO_DB + "_benchmark", which is dropped afterwards.
+Indexes from app.indexes are created first, so "before" is measured
+at its best.
+
+Usage: python benchmark_admin_stats.py
+"""
+import asyncio
+import random
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import ServerSelectionTimeoutError
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.core.config import get_settings
+from app.indexes import ensure_indexes
+from app.utils.admin_stats import dashboard_stats, route_summaries, system_stats
+
+ROUTES = 200
+BUSES_PER_ROUTE = 2
+STUDENTS = 20_000
+STOPS_PER_ROUTE = 12
+REPEATS = 10
+
+
+async def seed(db):
+    rng = random.Random(42)
+    today = date.today().isoformat()
+    routes = [
+        {"name": f"Route {r}", "stops": [f"Stop {r}-{s}" for s in range(STOPS_PER_ROUTE)]}
+        for r in range(ROUTES)
+    ]
+    drivers = [
+        {"email": f"driver{d}@bench.test", "name": f"Driver {d}", "role": "driver"}
+        for d in range(ROUTES * BUSES_PER_ROUTE)
+    ]
+    await db.routes.insert_many(routes)
+    driver_ids = (await db.users.insert_many(drivers)).inserted_ids
+    await db.buses.insert_many([
+        {
+            "number": f"AP29B{i:04d}",
+            "route": f"Route {i // BUSES_PER_ROUTE}",
+            # ~10% of buses idle
+            "driverId": str(driver_ids[i]) if rng.random() > 0.1 else None
+        }
+        for i in range(ROUTES * BUSES_PER_ROUTE)
+    ])
+    students = []
+    for i in range(STUDENTS):
+        route = rng.randrange(ROUTES)
+        students.append({
+            "email": f"student{i}@bench.test",
+            "roll_no": f"BENCH{i:05d}",
+            "name": f"Student {i}",
+            "role": "student",
+            "route": f"Route {route}",
+            "assignedBus": f"AP29B{route * BUSES_PER_ROUTE + rng.randrange(BUSES_PER_ROUTE):04d}"
+        })
+    await db.users.insert_many(students)
+    await db.leave_requests.insert_many([
+        {"driverId": str(driver_ids[i]), "date": today, "status": rng.choice(["pending", "approved"])}
+        for i in range(50)
+    ])
+    await db.complaints.insert_many([
+        {"studentId": f"s{i}", "status": rng.choice(["pending", "resolved"]), "submittedAt": today}
+        for i in range(200)
+    ])
+    await db.attendance.insert_many([
+        {"roll_no": f"BENCH{i:05d}", "date": today, "status": "Boarded"}
+        for i in range(0, STUDENTS, 3)
+    ])
+
+
+# ---------- previous implementations (sequential counts per route) ----------
+
+async def dashboard_before(db):
+    statistics = {
+        "totalBuses": await db.buses.count_documents({}),
+        "totalStudents": await db.users.count_documents({"role": "student"}),
+        "totalDrivers": await db.users.count_documents({"role": "driver"}),
+        "totalRoutes": await db.routes.count_documents({}),
+        "runningBuses": await db.buses.count_documents({"driverId": {"$exists": True, "$ne": None}}),
+        "pendingLeaves": await db.leave_requests.count_documents({"status": "pending"}),
+        "pendingComplaints": await db.complaints.count_documents({"status": "pending"}),
+    }
+    routes = []
+    async for route in db.routes.find({}, {"_id": 0}):
+        routes.append({
+            "name": route["name"],
+            "busCount": await db.buses.count_documents({"route": route["name"]}),
+            "studentCount": await db.users.count_documents({"role": "student", "route": route["name"]}),
+            "stops": len(route.get("stops", []))
+        })
+    return statistics, routes
+
+
+async def routes_before(db):
+    routes = []
+    async for route in db.routes.find({}, {"_id": 0}):
+        route["busCount"] = await db.buses.count_documents({"route": route["name"]})
+        route["studentCount"] = await db.users.count_documents({"role": "student", "route": route["name"]})
+        route["driverCount"] = len([bus async for bus in db.buses.find({"route": route["name"]}) if bus.get("driverId")])
+        route["stopCount"] = len(route.get("stops", []))
+        routes.append(route)
+    return routes
+
+
+async def statistics_before(db):
+    return {
+        "buses": await db.buses.count_documents({}),
+        "running": await db.buses.count_documents({"driverId": {"$exists": True, "$ne": None}}),
+        "students": await db.users.count_documents({"role": "student"}),
+        "drivers": await db.users.count_documents({"role": "driver"}),
+        "assigned": await db.buses.count_documents({"driverId": {"$exists": True, "$ne": None}}),
+        "routes": await db.routes.count_documents({}),
+        "leaves": await db.leave_requests.count_documents({"status": "pending"}),
+        "complaints": await db.complaints.count_documents({"status": "pending"}),
+        "attendance": await db.attendance.count_documents({"date": date.today().isoformat()}),
+    }
+
+
+# ---------- same numbers from the aggregated implementation ----------
+
+async def dashboard_after(db):
+    stats = await dashboard_stats(db)
+    statistics = {
+        "totalBuses": stats["buses"]["total"],
+        "totalStudents": stats["users"]["roles"].get("student", 0),
+        "totalDrivers": stats["users"]["roles"].get("driver", 0),
+        "totalRoutes": len(stats["routes"]),
+        "runningBuses": stats["buses"]["running"],
+        "pendingLeaves": stats["pending"]["leaves"],
+        "pendingComplaints": stats["pending"]["complaints"],
+    }
+    routes = [
+        {"name": r["name"], "busCount": r["busCount"], "studentCount": r["studentCount"], "stops": r["stopCount"]}
+        for r in stats["routes"]
+    ]
+    return statistics, routes
+
+
+async def statistics_after(db):
+    stats = await system_stats(db)
+    return {
+        "buses": stats["buses"]["total"],
+        "running": stats["buses"]["running"],
+        "students": stats["users"]["roles"].get("student", 0),
+        "drivers": stats["users"]["roles"].get("driver", 0),
+        "assigned": stats["buses"]["running"],
+        "routes": stats["total_routes"],
+        "leaves": stats["pending"]["leaves"],
+        "complaints": stats["pending"]["complaints"],
+        "attendance": stats["attendance_today"],
+    }
+
+
+async def measure(fn, db) -> tuple:
+    """(result, mean ms, p95 ms) over REPEATS runs"""
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        result = await fn(db)
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, float(np.mean(timings)), float(np.percentile(timings, 95))
+
+
+async def main():
+    settings = get_settings()
+    client = AsyncIOMotorClient(settings.MONGO_URI, serverSelectionTimeoutMS=5000)
+    db = client[settings.MONGO_DB + "_benchmark"]
+    try:
+        await client.drop_database(db.name)
+    except ServerSelectionTimeoutError:
+        print("\n❌ No MongoDB server reachable at MONGO_URI; nothing was measured\n")
+        client.close()
+        return 1
+    try:
+        print(f"\nSeeding {db.name}: {ROUTES} routes, {ROUTES * BUSES_PER_ROUTE} buses, {STUDENTS} students...")
+        await ensure_indexes(db)
+        await seed(db)
+
+        print(f"\n{'endpoint':<12} | {'before ms':>9} | {'p95':>7} | {'after ms':>8} | {'p95':>7} | {'speedup':>7} | same")
+        print("-" * 72)
+        for name, before, after in [
+            ("dashboard", dashboard_before, dashboard_after),
+            ("routes", routes_before, route_summaries),
+            ("statistics", statistics_before, statistics_after),
+        ]:
+            old, old_mean, old_p95 = await measure(before, db)
+            new, new_mean, new_p95 = await measure(after, db)
+            print(f"{name:<12} | {old_mean:>9.1f} | {old_p95:>7.1f} | {new_mean:>8.1f} | {new_p95:>7.1f} | "
+                  f"{old_mean / new_mean:>6.1f}x | {'yes' if old == new else 'NO'}")
+        print()
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
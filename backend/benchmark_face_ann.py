@@ -0,0 +1,87 @@
+"""
+Benchmark: exact vs IVF approximate face gallery search
+Reports per-frame latency and recall (how often the approximate top-1 /
+top-3 agrees with exact search) for several probe counts.
+
+Usage: python benchmark_face_ann.py
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from face_gallery import FaceGallery, IVFIndex
+
+GALLERY_SIZES = [10_000, 100_000]
+EMBEDDING_DIM = 512   # Facenet512
+IDENTITIES_PER_CLUSTER = 40
+PROBES = [1, 4, 8, 16]
+QUERIES = 200
+
+
+def make_database(rng: np.random.Generator, size: int) -> list:
+    """
+    Synthetic gallery with some structure, like real face embeddings:
+    identities share loose clusters and each has three nearby views
+    """
+    students = size // 3
+    clusters = rng.standard_normal((max(1, students // IDENTITIES_PER_CLUSTER), EMBEDDING_DIM))
+    identities = clusters[rng.integers(len(clusters), size=students)] + 0.8 * rng.standard_normal((students, EMBEDDING_DIM))
+    embeddings = np.repeat(identities, 3, axis=0) + 0.3 * rng.standard_normal((students * 3, EMBEDDING_DIM))
+    return [
+        {
+            "roll_no": f"R{i // 3:06d}",
+            "name": f"Student {i // 3}",
+            "view": ("front", "left", "right")[i % 3],
+            "embedding": embedding,
+        }
+        for i, embedding in enumerate(embeddings)
+    ]
+
+
+def main():
+    rng = np.random.default_rng(42)
+
+    print(f"\n{EMBEDDING_DIM}-d embeddings, {QUERIES} queries per row\n")
+    print(f"{'encodings':>9} | {'search':>10} | {'ms/frame':>8} | {'recall@1':>8} | {'recall@3':>8}")
+    print("-" * 57)
+
+    for size in GALLERY_SIZES:
+        database = make_database(rng, size)
+        gallery = FaceGallery(IVFIndex(min_size=0))
+        started = time.perf_counter()
+        gallery.rebuild(database)
+        build_s = time.perf_counter() - started
+
+        # Fresh captures of enrolled students
+        targets = rng.integers(size, size=QUERIES)
+        queries = [database[t]["embedding"] + 0.3 * rng.standard_normal(EMBEDDING_DIM) for t in targets]
+
+        started = time.perf_counter()
+        exact = [gallery.search(q, k=3, exact=True) for q in queries]
+        exact_ms = (time.perf_counter() - started) * 1000 / QUERIES
+        print(f"{size:>9} | {'exact':>10} | {exact_ms:>8.3f} | {1.0:>8.3f} | {1.0:>8.3f}")
+
+        for probes in PROBES:
+            gallery.index.n_probes = probes
+            started = time.perf_counter()
+            approx = [gallery.search(q, k=3) for q in queries]
+            approx_ms = (time.perf_counter() - started) * 1000 / QUERIES
+
+            top1 = np.mean([a[0][0] == e[0][0] for a, e in zip(approx, exact)])
+            top3 = np.mean([
+                len({r for r, _ in a} & {r for r, _ in e}) / len(e)
+                for a, e in zip(approx, exact)
+            ])
+            label = f"ivf p={probes}"
+            print(f"{size:>9} | {label:>10} | {approx_ms:>8.3f} | {top1:>8.3f} | {top3:>8.3f}")
+        print(f"{'':>9} | index built in {build_s:.1f}s with {len(gallery.index.centroids)} lists")
+        print("-" * 57)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark: Facenet512 embedding throughput and latency by batch size
+Runs the embedding forward pass (face_inference.embed_faces) on
+preprocessed synthetic face crops at batch sizes 1, 4, 8 and 16, then
+replays a burst of concurrent requests through the MicroBatcher.
+
+Needs the full face stack (deepface, tensorflow) and downloads the
+Facenet512 weights on first run. --untrained times the same network
+with random weights (forward-pass cost does not depend on them) when
+the weights cannot be downloaded; the burst replay is skipped then.
+
+Usage: python benchmark_face_batching.py [--untrained]
+"""
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from face_inference import MODEL_NAME, InferenceExecutor, MicroBatcher, embed_faces
+
+BATCH_SIZES = [1, 4, 8, 16]
+FACES = 64          # faces embedded per measurement
+BURST = 16          # concurrent requests in the burst replay
+REPEATS = 3
+
+
+def make_faces(count: int, input_shape: tuple) -> list:
+    """Preprocessed faces shaped like detect_face output"""
+    height, width = input_shape
+    rng = np.random.default_rng(42)
+    return [rng.random((1, height, width, 3), dtype=np.float32) * 255 for _ in range(count)]
+
+
+def untrained_embed():
+    """Facenet512 architecture with random weights"""
+    from deepface.models.facial_recognition.Facenet import InceptionResNetV1
+    model = InceptionResNetV1(dimension=512)
+    return (160, 160), lambda faces: model(np.concatenate(faces, axis=0), training=False).numpy().tolist()
+
+
+def measure(embed, faces: list, batch_size: int) -> tuple:
+    """Best-of-REPEATS (faces per second, ms per forward pass)"""
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for i in range(0, len(faces), batch_size):
+            embed(faces[i:i + batch_size])
+        best = min(best, time.perf_counter() - start)
+    batches = -(-len(faces) // batch_size)
+    return len(faces) / best, best * 1000 / batches
+
+
+async def burst(faces: list, window_ms: float, max_batch: int) -> tuple:
+    """BURST requests arriving together: (mean, max) request latency in ms"""
+    executor = InferenceExecutor()
+    executor.executor = ThreadPoolExecutor(max_workers=1)  # one model, no settings needed
+    executor.queue_depth = len(faces) + 1
+    batcher = MicroBatcher(executor)
+    batcher.window = window_ms / 1000
+    batcher.max_batch = max_batch
+
+    async def request(face):
+        start = time.perf_counter()
+        await batcher.embed(face)
+        return (time.perf_counter() - start) * 1000
+
+    latencies = await asyncio.gather(*(request(face) for face in faces))
+    executor.shutdown()
+    return float(np.mean(latencies)), float(np.max(latencies))
+
+
+def main():
+    untrained = "--untrained" in sys.argv
+    if untrained:
+        input_shape, embed = untrained_embed()
+    else:
+        from deepface import DeepFace
+        input_shape, embed = DeepFace.build_model(MODEL_NAME).input_shape, embed_faces
+    faces = make_faces(FACES, input_shape)
+    embed(faces[:1])  # build the graph before timing
+
+    label = f"{MODEL_NAME} (untrained)" if untrained else MODEL_NAME
+    print(f"\n{label}, {FACES} faces, best of {REPEATS} runs\n")
+    print(f"{'batch':>5} | {'faces/s':>8} | {'ms/pass':>8} | {'speedup':>7}")
+    print("-" * 40)
+    baseline = None
+    for batch_size in BATCH_SIZES:
+        throughput, latency = measure(embed, faces, batch_size)
+        baseline = baseline or throughput
+        print(f"{batch_size:>5} | {throughput:>8.1f} | {latency:>8.2f} | {throughput / baseline:>6.2f}x")
+
+    if untrained:
+        print()
+        return
+
+    print(f"\nBurst of {BURST} concurrent requests through the MicroBatcher (20 ms window)\n")
+    print(f"{'max batch':>9} | {'mean ms':>8} | {'max ms':>8}")
+    print("-" * 32)
+    for batch_size in BATCH_SIZES:
+        mean_ms, max_ms = asyncio.run(burst(faces[:BURST], 20, batch_size))
+        print(f"{batch_size:>9} | {mean_ms:>8.1f} | {max_ms:>8.1f}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Microbenchmark: per-stop Python loop vs NumPy route geometry
+Compares coverage.calculate_current_stop_index (one bus at a time) with
+RouteGeometry computing every bus in one batched call.
+
+Usage: python benchmark_route_geometry.py
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.utils.coverage import calculate_current_stop_index
+from app.utils.route_geometry import RouteGeometry
+
+BUS_COUNTS = [10, 100, 1000]
+STOPS_PER_ROUTE = 25
+REPEATS = 20
+
+
+def make_route(rng: np.random.Generator) -> dict:
+    """A synthetic route heading roughly north-east from Vijayawada"""
+    lats = 16.50 + np.cumsum(rng.uniform(0.002, 0.01, STOPS_PER_ROUTE))
+    lons = 80.60 + np.cumsum(rng.uniform(0.002, 0.01, STOPS_PER_ROUTE))
+    return {
+        "name": "Benchmark Route",
+        "stops": [
+            {"name": f"Stop {i}", "lat": float(lat), "long": float(lon)}
+            for i, (lat, lon) in enumerate(zip(lats, lons))
+        ],
+    }
+
+
+def time_call(fn) -> float:
+    """Best-of-REPEATS wall time in milliseconds"""
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    rng = np.random.default_rng(42)
+    route = make_route(rng)
+    geometry = RouteGeometry(route)
+
+    print(f"\nRoute with {STOPS_PER_ROUTE} stops, best of {REPEATS} runs\n")
+    print(f"{'buses':>6} | {'loop (ms)':>10} | {'nearest (ms)':>12} | {'progress (ms)':>13} | {'speedup':>7}")
+    print("-" * 62)
+
+    for count in BUS_COUNTS:
+        lats = rng.uniform(16.50, 16.50 + STOPS_PER_ROUTE * 0.006, count)
+        lons = rng.uniform(80.60, 80.60 + STOPS_PER_ROUTE * 0.006, count)
+        fixes = [{"lat": float(lat), "long": float(lon)} for lat, lon in zip(lats, lons)]
+        previous = np.full(count, np.nan)
+        elapsed = np.full(count, np.nan)
+
+        loop_ms = time_call(lambda: [calculate_current_stop_index(fix, route) for fix in fixes])
+        nearest_ms = time_call(lambda: geometry.nearest_stop_indices(lats, lons))
+        progress_ms = time_call(lambda: geometry.progress(lats, lons, previous, elapsed))
+
+        # The vectorized path must agree with the scalar rule it replaces
+        expected = [calculate_current_stop_index(fix, route) for fix in fixes]
+        assert list(geometry.nearest_stop_indices(lats, lons)) == expected
+
+        print(f"{count:>6} | {loop_ms:>10.3f} | {nearest_ms:>12.3f} | {progress_ms:>13.3f} | {loop_ms / nearest_ms:>6.1f}x")
+    print()
+
+
+if __name__ == "__main__":
+    main()
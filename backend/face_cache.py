@@ -0,0 +1,56 @@
+"""
+Face Recognition Caches
+ESP32 devices retry uploads on timeout and resend frames of a student
+standing at the door; these bounded LRU caches with a short TTL let exact
+repeats skip detection and/or the embedding model.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+def content_hash(image_data: bytes) -> bytes:
+    """Digest of raw bytes (an upload or a face crop); identical input hashes identically"""
+    return hashlib.blake2b(image_data, digest_size=16).digest()
+
+
+class TTLCache:
+    """LRU of at most max_size entries, each valid for ttl seconds"""
+    def __init__(self, max_size: int = 256, ttl: float = 10.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None
+        }
@@ -0,0 +1,163 @@
+"""
+Face Detector Cascade
+Stage 1 is a cheap pre-filter on a downscaled grayscale copy of the
+frame: a Haar face detector plus a Laplacian sharpness check. It rejects
+empty doorway frames, faces too far from the camera and motion-blurred
+frames before they reach stage 2 (DeepFace detection, alignment and the
+embedding model). Thresholds have global defaults in settings and can be
+overridden per bus (stored on the bus document as faceCascade).
+"""
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+CASCADE_FIELDS = ("enabled", "width", "min_face", "min_sharpness")
+SHARPNESS_CROP = (64, 64)  # faces are resized to this before measuring blur
+REJECTION_MESSAGES = {
+    "no_face": "No face detected in image",
+    "too_small": "Face too small - move closer to the camera",
+    "blurry": "Image too blurry - hold still in front of the camera"
+}
+
+_face_detector = None  # one per worker process
+
+
+def _detector() -> "cv2.CascadeClassifier":
+    global _face_detector
+    if _face_detector is None:
+        _face_detector = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    return _face_detector
+
+
+def prefilter(image: np.ndarray, config: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Stage 1 on a decoded BGR frame. Returns (rejection reason or None, details);
+    the reason is one of REJECTION_MESSAGES.
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, config["width"] / width)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if scale < 1.0:
+        gray = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    # Permissive settings: a miss here drops the frame, stage 2 filters false positives
+    faces = _detector().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=2, minSize=(20, 20))
+    if len(faces) == 0:
+        return "no_face", {}
+
+    x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+    face_px = int(w / scale)
+    if face_px < config["min_face"]:
+        return "too_small", {"face_px": face_px}
+
+    # Variance of the Laplacian over the face: low means few edges, i.e. blur.
+    # A fixed-size crop keeps the score comparable between near and far faces.
+    crop = cv2.resize(gray[y:y + h, x:x + w], SHARPNESS_CROP, interpolation=cv2.INTER_AREA)
+    sharpness = float(cv2.Laplacian(crop, cv2.CV_64F).var())
+    if sharpness < config["min_sharpness"]:
+        return "blurry", {"face_px": face_px, "sharpness": round(sharpness, 1)}
+    return None, {"face_px": face_px, "sharpness": round(sharpness, 1)}
+
+
+class FaceCascade:
+    def __init__(self):
+        self.buses: Dict[str, Dict[str, Any]] = {}  # per-bus overrides
+        self.stats: Dict[str, Any] = {}
+        self.reset_stats()
+
+    def defaults(self) -> Dict[str, Any]:
+        from app.core.config import get_settings
+        settings = get_settings()
+        return {
+            "enabled": settings.FACE_CASCADE,
+            "width": settings.FACE_PREFILTER_WIDTH,
+            "min_face": settings.FACE_MIN_FACE_PX,
+            "min_sharpness": settings.FACE_MIN_SHARPNESS
+        }
+
+    def config(self, bus_number: Optional[str] = None) -> Dict[str, Any]:
+        """Effective cascade settings for frames from a bus"""
+        return {**self.defaults(), **self.buses.get(bus_number, {})}
+
+    async def load(self, db: AsyncIOMotorDatabase):
+        """Load per-bus overrides from the buses collection"""
+        cursor = db.buses.find({"faceCascade": {"$exists": True}}, {"_id": 0, "number": 1, "faceCascade": 1})
+        self.buses = {
+            bus["number"]: bus["faceCascade"]
+            async for bus in cursor
+            if bus.get("faceCascade")
+        }
+        if self.buses:
+            print(f"✓ Face cascade overrides loaded for {len(self.buses)} buses")
+
+    async def set_bus(self, db: AsyncIOMotorDatabase, bus_number: str, overrides: Dict[str, Any]):
+        """Persist a bus's overrides; an empty dict restores the defaults"""
+        overrides = {k: v for k, v in overrides.items() if k in CASCADE_FIELDS and v is not None}
+        if overrides:
+            await db.buses.update_one({"number": bus_number}, {"$set": {"faceCascade": overrides}})
+            self.buses[bus_number] = overrides
+        else:
+            await db.buses.update_one({"number": bus_number}, {"$unset": {"faceCascade": ""}})
+            self.buses.pop(bus_number, None)
+
+    def rename_bus(self, bus_number: str, new_number: str):
+        if bus_number in self.buses:
+            self.buses[new_number] = self.buses.pop(bus_number)
+
+    def remove_bus(self, bus_number: str):
+        self.buses.pop(bus_number, None)
+
+    # ---------- statistics ----------
+
+    def reset_stats(self):
+        self.stats = {
+            "frames": 0,
+            "passed": 0,
+            "rejected": {"decode": 0, "no_face": 0, "too_small": 0, "blurry": 0, "detector": 0},
+            "stage_seconds": {"decode": 0.0, "prefilter": 0.0, "detect": 0.0, "embed": 0.0},
+            "stage_counts": {"decode": 0, "prefilter": 0, "detect": 0, "embed": 0}
+        }
+
+    def record(self, detected: Dict[str, Any]):
+        """Count one detect_face result and its per-stage timings"""
+        self.stats["frames"] += 1
+        for stage, seconds in detected.get("timings", {}).items():
+            self.record_stage(stage, seconds)
+        if detected["status"] == "success":
+            self.stats["passed"] += 1
+        else:
+            reason = detected.get("rejected", "detector")
+            self.stats["rejected"][reason] = self.stats["rejected"].get(reason, 0) + 1
+
+    def record_stage(self, stage: str, seconds: float):
+        self.stats["stage_seconds"][stage] += seconds
+        self.stats["stage_counts"][stage] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        stage_ms = {
+            stage: round(seconds * 1000 / self.stats["stage_counts"][stage], 2)
+            for stage, seconds in self.stats["stage_seconds"].items()
+            if self.stats["stage_counts"][stage]
+        }
+        return {
+            "defaults": self.defaults(),
+            "bus_overrides": self.buses,
+            "frames": self.stats["frames"],
+            "passed": self.stats["passed"],
+            "rejected": self.stats["rejected"],
+            "avg_stage_ms": stage_ms
+        }
+
+
+def timed(timings: Dict[str, float], stage: str, started: float) -> float:
+    """Record the time since started under stage; returns now"""
+    now = time.perf_counter()
+    timings[stage] = now - started
+    return now
+
+
+# Global cascade configuration and counters
+face_cascade = FaceCascade()
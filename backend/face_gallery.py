@@ -0,0 +1,352 @@
+"""
+Face Gallery
+Enrolled embeddings kept as one contiguous, L2-normalized float32 matrix
+with parallel metadata arrays, so matching a frame is a single
+matrix-vector product instead of a Python loop over every encoding.
+Large galleries can add an IVF (inverted file) index that only scans
+the clusters closest to the query, and rows are partitioned by assigned
+bus so a camera can search just its own riders first.
+"""
+import hashlib
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows (or a single vector) as float32"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate search: rows are clustered with spherical
+    k-means and a query only scans its n_probes nearest clusters
+    """
+    def __init__(self, n_lists: int = 0, n_probes: int = 8, min_size: int = 2000, path: Optional[str] = None):
+        self.n_lists = n_lists          # 0 = sqrt(gallery size)
+        self.n_probes = n_probes
+        self.min_size = min_size        # smaller galleries are searched exactly
+        self.path = path
+        self.centroids: Optional[np.ndarray] = None
+        self.assign = np.empty(0, dtype=np.int32)  # cluster of every gallery row
+        self.trained_size = 0
+        self._order: Optional[np.ndarray] = None   # rows grouped by cluster
+        self._bounds: Optional[np.ndarray] = None
+
+    def ready(self, size: int) -> bool:
+        return self.centroids is not None and size >= self.min_size
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return (vectors @ self.centroids.T).argmax(axis=1).astype(np.int32)
+
+    def train(self, matrix: np.ndarray, iterations: int = 10, sample: int = 20000, seed: int = 0):
+        """Cluster the gallery and assign every row to a list"""
+        size = len(matrix)
+        n_lists = self.n_lists or int(np.sqrt(size))
+        n_lists = max(1, min(n_lists, size))
+        rng = np.random.default_rng(seed)
+        train = matrix[rng.choice(size, min(size, max(sample, n_lists)), replace=False)]
+
+        centroids = train[rng.choice(len(train), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = (train @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, train)
+            empty = np.bincount(labels, minlength=n_lists) == 0
+            # Re-seed empty clusters from random training rows
+            sums[empty] = train[rng.choice(len(train), int(empty.sum()))]
+            centroids = normalize(sums)
+
+        self.centroids = centroids
+        self.assign = self._assign(matrix)
+        self.trained_size = size
+        self._order = None
+        print(f"✓ Trained face IVF index ({n_lists} lists over {size} encodings)")
+
+    def add(self, vectors: np.ndarray):
+        if self.centroids is None:
+            return
+        self.assign = np.concatenate([self.assign, self._assign(vectors)])
+        self._order = None
+
+    def remove(self, keep: np.ndarray):
+        if self.centroids is None:
+            return
+        self.assign = self.assign[keep]
+        self._order = None
+
+    def needs_training(self, size: int) -> bool:
+        """Train once the gallery is large enough, retrain after it doubles"""
+        if size < self.min_size:
+            return False
+        return self.centroids is None or size > 2 * self.trained_size
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        """Gallery rows in the n_probes clusters nearest the query"""
+        if self._order is None:
+            self._order = np.argsort(self.assign, kind="stable")
+            self._bounds = np.searchsorted(self.assign[self._order], np.arange(len(self.centroids) + 1))
+        scores = self.centroids @ query
+        probes = min(self.n_probes, len(scores))
+        nearest = np.argpartition(-scores, probes - 1)[:probes]
+        return np.concatenate([self._order[self._bounds[c]:self._bounds[c + 1]] for c in nearest])
+
+    # ---------- persistence ----------
+
+    def save(self, fingerprint: str):
+        if not self.path or self.centroids is None:
+            return
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(
+            tmp_path, centroids=self.centroids, assign=self.assign,
+            trained_size=self.trained_size, fingerprint=fingerprint
+        )
+        os.replace(tmp_path, self.path)
+
+    def load(self, fingerprint: str, size: int) -> bool:
+        """Restore a saved index if it was built for exactly this gallery"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path) as data:
+                if str(data["fingerprint"]) != fingerprint or len(data["assign"]) != size:
+                    return False
+                self.centroids = data["centroids"].astype(np.float32)
+                self.assign = data["assign"].astype(np.int32)
+                self.trained_size = int(data["trained_size"])
+        except Exception as e:
+            print(f"Error loading face index: {e}")
+            return False
+        self._order = None
+        print(f"✓ Loaded face IVF index ({len(self.centroids)} lists)")
+        return True
+
+    def reset(self):
+        self.centroids = None
+        self.assign = np.empty(0, dtype=np.int32)
+        self.trained_size = 0
+        self._order = None
+
+
+class FaceGallery:
+    def __init__(self, index: Optional[IVFIndex] = None):
+        self.index = index  # None = always exact search
+        self.dim: Optional[int] = None
+        self.size = 0
+        # Over-allocated buffers; rows [0, size) are live
+        self.buffer = np.empty((0, 0), dtype=np.float32)
+        self.roll_nos = np.empty(0, dtype=object)
+        self.names = np.empty(0, dtype=object)
+        self.views = np.empty(0, dtype=object)
+        self.version = 0  # embedding store version the rows came from
+        # Bus partitions: roll_no -> assigned bus, and bus -> gallery rows (built lazily)
+        self.bus_of: Dict[str, Optional[str]] = {}
+        self._partitions: Optional[Dict[Optional[str], np.ndarray]] = None
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self.buffer[:self.size]
+
+    def _reserve(self, rows: int):
+        """Grow the buffers geometrically so repeated enrollments stay amortized O(1)"""
+        needed = self.size + rows
+        if needed <= len(self.buffer):
+            return
+        capacity = max(needed, 2 * len(self.buffer), 64)
+        buffer = np.empty((capacity, self.dim), dtype=np.float32)
+        buffer[:self.size] = self.matrix
+        self.buffer = buffer
+        for attr in ("roll_nos", "names", "views"):
+            grown = np.empty(capacity, dtype=object)
+            grown[:self.size] = getattr(self, attr)[:self.size]
+            setattr(self, attr, grown)
+
+    def fingerprint(self) -> str:
+        """Identifies the exact row layout a saved index belongs to"""
+        digest = hashlib.sha1(f"v{self.version}\n".encode())
+        for roll_no, view in zip(self.roll_nos[:self.size], self.views[:self.size]):
+            digest.update(f"{roll_no}/{view}\n".encode())
+        return digest.hexdigest()
+
+    def _reset(self):
+        self.dim = None
+        self.size = 0
+        self.buffer = np.empty((0, 0), dtype=np.float32)
+        self.roll_nos = np.empty(0, dtype=object)
+        self.names = np.empty(0, dtype=object)
+        self.views = np.empty(0, dtype=object)
+        self._partitions = None
+        if self.index is not None:
+            self.index.reset()
+
+    def rebuild(self, entries: List[Dict]):
+        """Replace the gallery with the given face database entries"""
+        self._reset()
+        self._append(entries)
+        self._restore_index()
+
+    def load_matrix(self, matrix: np.ndarray, rows: List[Dict], version: int = 0):
+        """
+        Adopt an already-normalized matrix (e.g. a read-only memmap) without
+        copying it; it is only copied when the gallery is first modified
+        """
+        self._reset()
+        self.version = version
+        if not len(rows):
+            return
+        self.dim = matrix.shape[1]
+        self.buffer = matrix
+        self.size = len(rows)
+        self.roll_nos = np.array([row["roll_no"] for row in rows], dtype=object)
+        self.names = np.array([row["name"] for row in rows], dtype=object)
+        self.views = np.array([row.get("view", "unknown") for row in rows], dtype=object)
+        self._restore_index()
+
+    def _restore_index(self):
+        if self.index is not None and self.size >= self.index.min_size:
+            if not self.index.load(self.fingerprint(), self.size):
+                self.index.train(self.matrix)
+                self.save_index()
+
+    def add(self, entries: List[Dict]):
+        """Append face database entries ({roll_no, name, view, embedding})"""
+        vectors = self._append(entries)
+        if self.index is None or vectors is None:
+            return
+        if self.index.needs_training(self.size):
+            self.index.train(self.matrix)
+        else:
+            self.index.add(vectors)
+        self.save_index()
+
+    def save_index(self):
+        if self.index is not None:
+            self.index.save(self.fingerprint())
+
+    def _append(self, entries: List[Dict]) -> Optional[np.ndarray]:
+        if not entries:
+            return None
+        vectors = normalize(np.stack([np.asarray(e["embedding"], dtype=np.float32) for e in entries]))
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.buffer = np.empty((0, self.dim), dtype=np.float32)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding size {vectors.shape[1]} does not match gallery size {self.dim}")
+
+        self._reserve(len(entries))
+        end = self.size + len(entries)
+        self.buffer[self.size:end] = vectors
+        self.roll_nos[self.size:end] = [e["roll_no"] for e in entries]
+        self.names[self.size:end] = [e["name"] for e in entries]
+        self.views[self.size:end] = [e.get("view", "unknown") for e in entries]
+        self.size = end
+        self._partitions = None
+        return vectors
+
+    def remove(self, roll_no: str) -> int:
+        """Drop every encoding of a student; returns how many were removed"""
+        keep = self.roll_nos[:self.size] != roll_no
+        removed = self.size - int(keep.sum())
+        if removed:
+            kept = int(keep.sum())
+            if not self.buffer.flags.writeable:
+                self.buffer = np.array(self.matrix)
+            self.buffer[:kept] = self.matrix[keep]
+            for attr in ("roll_nos", "names", "views"):
+                array = getattr(self, attr)
+                array[:kept] = array[:self.size][keep]
+                array[kept:self.size] = None
+            self.size = kept
+            self._partitions = None
+            if self.index is not None:
+                self.index.remove(keep)
+                self.save_index()
+        return removed
+
+    # ---------- bus partitions ----------
+
+    def set_buses(self, assignments: Dict[str, Optional[str]]):
+        """Replace every student's bus assignment"""
+        self.bus_of = dict(assignments)
+        self._partitions = None
+
+    def set_bus(self, roll_no: str, bus_number: Optional[str]):
+        if self.bus_of.get(roll_no) != bus_number:
+            self.bus_of[roll_no] = bus_number
+            self._partitions = None
+
+    def rename_bus(self, bus_number: str, new_number: str):
+        for roll_no, bus in self.bus_of.items():
+            if bus == bus_number:
+                self.bus_of[roll_no] = new_number
+        self._partitions = None
+
+    def partition(self, bus_number: Optional[str]) -> np.ndarray:
+        """Gallery rows of the students assigned to a bus"""
+        if self._partitions is None:
+            groups: Dict[Optional[str], List[int]] = defaultdict(list)
+            for row, roll_no in enumerate(self.roll_nos[:self.size]):
+                groups[self.bus_of.get(roll_no)].append(row)
+            self._partitions = {bus: np.asarray(rows, dtype=np.int64) for bus, rows in groups.items()}
+        return self._partitions.get(bus_number, np.empty(0, dtype=np.int64))
+
+    # ---------- search ----------
+
+    def search(
+        self,
+        embedding,
+        k: int = 3,
+        exact: bool = False,
+        bus_number: Optional[str] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Top-k (row, cosine distance) pairs, closest first.
+        Cosine distance is 1 - dot product of the normalized vectors.
+        With bus_number only that bus's riders are searched (exactly).
+        """
+        if not self.size:
+            return []
+        query = normalize(embedding)
+        if bus_number is not None:
+            rows = self.partition(bus_number)
+            scores = self.matrix[rows] @ query
+        elif not exact and self.index is not None and self.index.ready(self.size):
+            rows = self.index.candidates(query)
+            scores = self.matrix[rows] @ query
+        else:
+            rows = None
+            scores = self.matrix @ query
+        if not len(scores):
+            return []
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        if rows is None:
+            return [(int(i), max(0.0, float(1.0 - scores[i]))) for i in top]
+        return [(int(rows[i]), max(0.0, float(1.0 - scores[i]))) for i in top]
+
+    def get_stats(self) -> Dict[str, Any]:
+        index = self.index
+        approximate = index is not None and index.ready(self.size)
+        return {
+            "mode": "ivf" if approximate else "exact",
+            "encodings": self.size,
+            "lists": len(index.centroids) if approximate else None,
+            "probes": index.n_probes if approximate else None,
+            "bus_partitions": len(self._partitions) if self._partitions is not None else None
+        }
+
+    def students(self) -> set:
+        """Roll numbers with at least one encoding"""
+        return set(self.roll_nos[:self.size])
+
+    def entry(self, row: int) -> Dict:
+        return {"roll_no": self.roll_nos[row], "name": self.names[row], "view": self.views[row]}
@@ -0,0 +1,376 @@
+"""
+Face Inference Executor
+Runs DeepFace embedding extraction off the event loop in a bounded
+thread or process pool, so one camera frame never stalls the API.
+Face detection runs per frame; the embedding model runs on micro-batches
+of face crops collected across concurrent requests.
+"""
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import cv2
+import numpy as np
+
+# DeepFace configuration
+MODEL_NAME = "Facenet512"  # Best balance of accuracy and speed
+DISTANCE_METRIC = "cosine"  # cosine, euclidean, euclidean_l2
+DETECTOR_BACKEND = "opencv"  # opencv, ssd, dlib, mtcnn, retinaface
+
+
+class InferenceBusy(Exception):
+    """Raised when the inference queue is full; callers should back off"""
+    def __init__(self, retry_after: int = 2):
+        super().__init__("Face inference queue is full")
+        self.retry_after = retry_after
+
+
+# ==================== WORKER FUNCTIONS ====================
+# Top-level so they can run in a process pool
+
+def preload_model():
+    """Build the embedding model once per worker"""
+    from deepface import DeepFace
+    DeepFace.build_model(MODEL_NAME)
+
+
+def warm_up_model() -> Dict[str, float]:
+    """
+    Build the embedding model and face detector, then run one synthetic
+    detection and forward pass so the first real frame pays for neither.
+    Returns the time each stage took, in seconds.
+    """
+    from deepface import DeepFace
+    from deepface.modules import detection, modeling
+
+    timings = {}
+    started = time.perf_counter()
+    model = DeepFace.build_model(MODEL_NAME)
+    timings["model_seconds"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    modeling.build_model(task="face_detector", model_name=DETECTOR_BACKEND)
+    timings["detector_seconds"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    height, width = model.input_shape
+    detection.extract_faces(
+        img_path=np.zeros((height * 2, width * 2, 3), dtype=np.uint8),
+        detector_backend=DETECTOR_BACKEND,
+        enforce_detection=False
+    )
+    embed_faces([np.zeros((1, height, width, 3), dtype=np.float32)])
+    timings["inference_seconds"] = round(time.perf_counter() - started, 3)
+    return timings
+
+
+def decode_image(image_data: bytes) -> Optional[np.ndarray]:
+    """Decode JPEG/PNG bytes straight into a BGR array (None if undecodable)"""
+    return cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def detect_face(image_data: bytes, cascade: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Decode a camera frame, detect the first face and preprocess it for the model
+    With cascade (see face_cascade), a cheap pre-filter rejects frames before
+    the DeepFace detector runs; rejections carry "rejected" with the reason.
+    Returns {"status": "success", "face": (1, h, w, 3) array, "facial_area", "timings"} or an error dict
+    """
+    from deepface import DeepFace
+    from deepface.modules import detection, preprocessing
+    from face_cascade import REJECTION_MESSAGES, prefilter, timed
+
+    # Decode once; the array goes straight to the model, nothing touches disk
+    timings = {}
+    started = time.perf_counter()
+    image = decode_image(image_data)
+    started = timed(timings, "decode", started)
+    if image is None:
+        return {"status": "error", "message": "Failed to decode image", "rejected": "decode", "timings": timings}
+
+    # Stage 1: downscaled grayscale pre-filter
+    if cascade and cascade.get("enabled"):
+        reason, details = prefilter(image, cascade)
+        started = timed(timings, "prefilter", started)
+        if reason:
+            return {
+                "status": "error",
+                "message": REJECTION_MESSAGES[reason],
+                "rejected": reason,
+                "timings": timings,
+                **details
+            }
+
+    # Stage 2: full detector and alignment
+    try:
+        img_objs = detection.extract_faces(
+            img_path=image,
+            detector_backend=DETECTOR_BACKEND,
+            grayscale=False,
+            enforce_detection=True,
+            align=True
+        )
+    except Exception as e:
+        timed(timings, "detect", started)
+        if "Face could not be detected" in str(e):
+            return {"status": "error", "message": "No face detected in image", "timings": timings}
+        return {"status": "error", "message": f"Face detection error: {str(e)}", "timings": timings}
+    if not img_objs:
+        timed(timings, "detect", started)
+        return {"status": "error", "message": "No face detected in image", "timings": timings}
+
+    # Same preprocessing as DeepFace.represent: RGB -> BGR, resize, normalize
+    target_size = DeepFace.build_model(MODEL_NAME).input_shape
+    face = preprocessing.resize_image(
+        img=img_objs[0]["face"][:, :, ::-1],
+        target_size=(target_size[1], target_size[0])
+    )
+    face = preprocessing.normalize_input(img=face, normalization="base")
+    timed(timings, "detect", started)
+    return {"status": "success", "face": face, "facial_area": img_objs[0]["facial_area"], "timings": timings}
+
+
+def embed_faces(faces: List[np.ndarray]) -> List[List[float]]:
+    """One forward pass of the embedding model over a batch of preprocessed faces"""
+    from deepface import DeepFace
+    model = DeepFace.build_model(MODEL_NAME)
+    batch = np.concatenate(faces, axis=0)
+    return model.model(batch, training=False).numpy().tolist()
+
+
+def extract_embedding(image_data: bytes) -> Dict[str, Any]:
+    """
+    Decode a camera frame and extract the face embedding
+    Returns {"status": "success", "embedding", "facial_area"} or an error dict
+    """
+    detected = detect_face(image_data)
+    if detected["status"] != "success":
+        return detected
+    return {
+        "status": "success",
+        "embedding": embed_faces([detected["face"]])[0],
+        "facial_area": detected["facial_area"]
+    }
+
+
+def encode_image_files(paths: List[str]) -> List[Dict[str, Any]]:
+    """Embeddings for a chunk of stored face images (used by the rebuild job)"""
+    results = []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                extracted = extract_embedding(f.read())
+        except OSError as e:
+            extracted = {"status": "error", "message": str(e)}
+        if extracted["status"] == "success":
+            results.append({"status": "success", "embedding": extracted["embedding"]})
+        else:
+            results.append({"status": "error", "message": extracted.get("message")})
+    return results
+
+
+# ==================== EXECUTOR ====================
+
+class InferenceExecutor:
+    def __init__(self):
+        self.executor: Optional[Executor] = None
+        self.mode = "thread"
+        self.workers = 2
+        self.queue_depth = 8
+        self.pending = 0
+        self.ready = False              # True once warm-up has finished
+        self.warmup: Dict[str, Any] = {}
+        self.stats = {
+            "completed": 0,
+            "rejected": 0,
+            "failed": 0,
+            "total_seconds": 0.0
+        }
+
+    def start(self):
+        """Create the pool from settings (called lazily on first use)"""
+        from app.core.config import get_settings
+        settings = get_settings()
+
+        self.mode = settings.FACE_EXECUTOR
+        self.workers = max(1, settings.FACE_WORKERS)
+        # Requests in flight beyond the workers wait in the queue
+        self.queue_depth = self.workers + max(0, settings.FACE_QUEUE_DEPTH)
+
+        if self.mode == "process":
+            # TensorFlow is not fork-safe; each worker builds the model once
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=preload_model
+            )
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="face-inference"
+            )
+        print(f"✓ Face inference executor started ({self.mode}, {self.workers} workers, queue {self.queue_depth})")
+
+    async def warm_up(self):
+        """Load the model and detector in every worker before traffic arrives"""
+        from app.core.config import get_settings
+        if not get_settings().FACE_WARMUP:
+            self.ready = True
+            return
+        if self.executor is None:
+            self.start()
+
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            # One warm-up per worker; idle process workers each pick one up
+            timings = await asyncio.gather(*(
+                loop.run_in_executor(self.executor, warm_up_model) for _ in range(self.workers)
+            ))
+        except Exception as e:
+            self.warmup = {"error": str(e)}
+            print(f"✗ Face model warm-up failed: {e}")
+            return
+        self.warmup = {
+            **timings[0],
+            "total_seconds": round(time.perf_counter() - started, 3)
+        }
+        self.ready = True
+        print(f"✓ Face model warmed up in {self.warmup['total_seconds']}s "
+              f"(model {timings[0]['model_seconds']}s, detector {timings[0]['detector_seconds']}s)")
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(*args) on the pool; raises InferenceBusy when the queue is full"""
+        if self.executor is None:
+            self.start()
+        if self.pending >= self.queue_depth:
+            self.stats["rejected"] += 1
+            raise InferenceBusy()
+
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+            self.stats["completed"] += 1
+            return result
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self.pending -= 1
+            self.stats["total_seconds"] += time.perf_counter() - started
+
+    def get_stats(self) -> Dict[str, Any]:
+        completed = self.stats["completed"] + self.stats["failed"]
+        return {
+            "mode": self.mode,
+            "ready": self.ready,
+            "warmup": self.warmup,
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.pending,
+            "completed": self.stats["completed"],
+            "failed": self.stats["failed"],
+            "rejected": self.stats["rejected"],
+            "avg_seconds": round(self.stats["total_seconds"] / completed, 4) if completed else None
+        }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+# ==================== MICRO-BATCHING ====================
+
+class MicroBatcher:
+    """
+    Collects preprocessed faces from concurrent requests for up to
+    window_ms (or until max_batch are waiting) and embeds them in one
+    forward pass on the inference pool
+    """
+    def __init__(self, executor: InferenceExecutor):
+        self.executor = executor
+        self.window = None
+        self.max_batch = 8
+        self.pending: List[Tuple[np.ndarray, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks: Set[asyncio.Task] = set()
+        self.stats = {"batches": 0, "faces": 0, "largest_batch": 0}
+
+    def _configure(self):
+        from app.core.config import get_settings
+        settings = get_settings()
+        self.window = max(0.0, settings.FACE_BATCH_WINDOW_MS) / 1000
+        self.max_batch = max(1, settings.FACE_BATCH_SIZE)
+
+    async def embed(self, face: np.ndarray) -> List[float]:
+        """Embedding of one preprocessed face, batched with its neighbours in time"""
+        if self.window is None:
+            self._configure()
+        if self.max_batch == 1 or self.window == 0:
+            return (await self.executor.run(embed_faces, [face]))[0]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((face, future))
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch: List[Tuple[np.ndarray, asyncio.Future]]):
+        try:
+            embeddings = await self.executor.run(embed_faces, [face for face, _ in batch])
+        except Exception as e:
+            # InferenceBusy (or a model error) reaches every waiting request
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.stats["batches"] += 1
+        self.stats["faces"] += len(batch)
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    def get_stats(self) -> Dict[str, Any]:
+        batches = self.stats["batches"]
+        return {
+            "window_ms": self.window * 1000 if self.window is not None else None,
+            "max_batch": self.max_batch,
+            **self.stats,
+            "avg_batch": round(self.stats["faces"] / batches, 2) if batches else None
+        }
+
+
+# Global inference executor and embedding batcher
+face_inference = InferenceExecutor()
+face_batcher = MicroBatcher(face_inference)
+
+
+async def extract_embedding_async(image_data: bytes) -> Dict[str, Any]:
+    """extract_embedding with detection on the pool and the embedding micro-batched"""
+    detected = await face_inference.run(detect_face, image_data)
+    if detected["status"] != "success":
+        return detected
+    return {
+        "status": "success",
+        "embedding": await face_batcher.embed(detected["face"]),
+        "facial_area": detected["facial_area"]
+    }
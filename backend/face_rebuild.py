@@ -0,0 +1,227 @@
+"""
+Face Gallery Rebuild Job
+Re-encodes every stored student image under FACES_DIR with the current
+MODEL_NAME / DETECTOR_BACKEND on a dedicated process pool, builds a new
+gallery version and swaps it in atomically. Live recognition keeps
+using the old version (and its own inference pool) until the swap.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from face_inference import MODEL_NAME, DETECTOR_BACKEND, encode_image_files, preload_model
+from face_gallery import normalize
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+MAX_SWAP_ATTEMPTS = 3  # catch-up rounds when enrollments race the swap
+
+# (roll_no, view, image path)
+ImageFile = Tuple[str, str, str]
+
+
+def find_face_images(faces_dir: str) -> List[ImageFile]:
+    """Every stored view image, as student_faces/<roll_no>/<view>.jpg"""
+    images = []
+    if not os.path.isdir(faces_dir):
+        return images
+    for roll_no in sorted(os.listdir(faces_dir)):
+        student_dir = os.path.join(faces_dir, roll_no)
+        if not os.path.isdir(student_dir):
+            continue
+        for file_name in sorted(os.listdir(student_dir)):
+            view, extension = os.path.splitext(file_name)
+            if extension.lower() in IMAGE_EXTENSIONS:
+                images.append((roll_no, view, os.path.join(student_dir, file_name)))
+    return images
+
+
+class FaceRebuildJob:
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.status: Dict[str, Any] = {"state": "idle"}
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self, service, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        """Start a rebuild in the background; returns the initial status"""
+        if self.running:
+            return self.status
+        self.status = {
+            "state": "starting",
+            "model": MODEL_NAME,
+            "detector": DETECTOR_BACKEND,
+            "started_at": datetime.utcnow(),
+            "total_images": 0,
+            "processed": 0,
+            "encoded": 0,
+            "failed": 0
+        }
+        self.task = asyncio.create_task(self._run(service, db))
+        return self.status
+
+    def get_status(self) -> Dict[str, Any]:
+        status = dict(self.status)
+        total = status.get("total_images")
+        if total:
+            status["percent"] = round(100 * status["processed"] / total, 1)
+        return status
+
+    async def _run(self, service, db: AsyncIOMotorDatabase):
+        from app.core.config import get_settings
+        from face_recognition_service import FACES_DIR
+
+        settings = get_settings()
+        started = time.perf_counter()
+        pool = ProcessPoolExecutor(
+            max_workers=max(1, settings.FACE_REBUILD_WORKERS),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=preload_model
+        )
+        try:
+            # Students known at the start; anything enrolled or removed later is caught up before the swap
+            start_rows = service.store.live_rows()
+            images = find_face_images(FACES_DIR)
+            self.status.update(state="encoding", total_images=len(images))
+            print(f"🔄 Rebuilding face gallery: {len(images)} images with {MODEL_NAME}/{DETECTOR_BACKEND}")
+
+            encoded = await self._encode(pool, images, settings.FACE_REBUILD_CHUNK)
+            names = await self._names(db, {roll_no for roll_no, _, _ in images}, start_rows)
+
+            start_students = {row["roll_no"] for row in start_rows}
+            caught_up: set = set()
+            for _ in range(MAX_SWAP_ATTEMPTS):
+                self.status["state"] = "swapping"
+                live_matrix, live_rows = service.store.live_matrix()
+                live_students = {row["roll_no"] for row in live_rows}
+
+                # Enrolled during the rebuild: encode their images now
+                added = live_students - start_students - caught_up
+                missing = [image for image in find_face_images(FACES_DIR) if image[0] in added]
+                self.status["total_images"] += len(missing)
+                encoded.update(await self._encode(pool, missing, settings.FACE_REBUILD_CHUNK))
+                names.update({row["roll_no"]: row["name"] for row in live_rows if row["roll_no"] in added})
+                caught_up |= added
+
+                # Removed during the rebuild: drop them
+                removed = (start_students | caught_up) - live_students
+                keys = [key for key in sorted(encoded) if key[0] not in removed]
+
+                rows = [
+                    {"roll_no": roll_no, "name": names.get(roll_no, roll_no), "view": view, "image_path": path}
+                    for roll_no, view, path in keys
+                ]
+                matrix = (
+                    normalize(np.stack([encoded[key] for key in keys]))
+                    if keys else np.empty((0, 0), dtype=np.float32)
+                )
+
+                # Live views with no fresh encoding (no stored image, or it failed) keep their vectors
+                fresh = {(roll_no, view) for roll_no, view, _ in keys}
+                kept = [i for i, row in enumerate(live_rows) if (row["roll_no"], row.get("view")) not in fresh]
+                if kept:
+                    matrix, rows = self._carry_over(service.store, matrix, rows, live_matrix, live_rows, kept)
+                info = {"model": MODEL_NAME, "detector": DETECTOR_BACKEND, "built_at": datetime.utcnow().isoformat()}
+                if service.store.replace(matrix, rows, expected=live_rows, info=info):
+                    break
+            else:
+                raise RuntimeError("Gallery kept changing during the swap; try again")
+
+            service.sync()
+            self.status.update(
+                state="done",
+                carried_over=len(rows) - len(keys),
+                version=service.store.version,
+                encodings=len(rows),
+                students=len({row["roll_no"] for row in rows}),
+                finished_at=datetime.utcnow(),
+                seconds=round(time.perf_counter() - started, 1)
+            )
+            print(f"✓ Face gallery v{service.store.version} swapped in: {len(rows)} encodings "
+                  f"in {self.status['seconds']}s")
+        except Exception as e:
+            self.status.update(state="failed", error=str(e), finished_at=datetime.utcnow())
+            print(f"✗ Face gallery rebuild failed: {e}")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _carry_over(
+        self,
+        store,
+        matrix: np.ndarray,
+        rows: List[Dict[str, Any]],
+        live_matrix: np.ndarray,
+        live_rows: List[Dict[str, Any]],
+        kept: List[int]
+    ) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        """
+        Append the current vectors of live rows that were not re-encoded.
+        Refuses (so the swap is aborted) if they came from another model,
+        since mixing embedding spaces would break matching.
+        """
+        students = sorted({live_rows[i]["roll_no"] for i in kept})
+        model = store.info.get("model")
+        if (model not in (None, MODEL_NAME)) or (len(rows) and matrix.shape[1] != live_matrix.shape[1]):
+            raise RuntimeError(
+                f"No new {MODEL_NAME} encodings for {len(students)} students "
+                f"(images missing or failed to encode): {', '.join(students)}"
+            )
+        print(f"  ↪ Keeping current encodings for {len(kept)} views of {len(students)} students "
+              f"without re-encodable images")
+        old = np.asarray(live_matrix[kept], dtype=np.float32)
+        matrix = np.concatenate([matrix, old]) if len(rows) else old
+        return matrix, rows + [dict(live_rows[i]) for i in kept]
+
+    async def _encode(
+        self,
+        pool: ProcessPoolExecutor,
+        images: List[ImageFile],
+        chunk_size: int
+    ) -> Dict[Tuple[str, str, str], List[float]]:
+        """Encode images in chunks across the pool, updating progress as chunks finish"""
+        loop = asyncio.get_running_loop()
+        chunk_size = max(1, chunk_size)
+        chunks = [images[i:i + chunk_size] for i in range(0, len(images), chunk_size)]
+
+        async def encode_chunk(chunk: List[ImageFile]):
+            results = await loop.run_in_executor(pool, encode_image_files, [path for _, _, path in chunk])
+            for image, result in zip(chunk, results):
+                self.status["processed"] += 1
+                if result["status"] == "success":
+                    self.status["encoded"] += 1
+                else:
+                    self.status["failed"] += 1
+                    print(f"  ✗ {image[2]}: {result.get('message')}")
+            return [(image, result["embedding"]) for image, result in zip(chunk, results)
+                    if result["status"] == "success"]
+
+        encoded = {}
+        for chunk_result in await asyncio.gather(*(encode_chunk(chunk) for chunk in chunks)):
+            encoded.update(chunk_result)
+        return encoded
+
+    async def _names(
+        self,
+        db: AsyncIOMotorDatabase,
+        roll_nos: set,
+        rows: List[Dict[str, Any]]
+    ) -> Dict[str, str]:
+        """Student names from MongoDB, falling back to the current gallery"""
+        names = {row["roll_no"]: row["name"] for row in rows}
+        cursor = db.users.find({"roll_no": {"$in": list(roll_nos)}}, {"_id": 0, "roll_no": 1, "name": 1})
+        async for student in cursor:
+            if student.get("name"):
+                names[student["roll_no"]] = student["name"]
+        return names
+
+
+# Global rebuild job
+face_rebuild = FaceRebuildJob()
@@ -2,28 +2,53 @@
 Face Recognition Service using DeepFace
 Handles face encoding, matching, and database management
 """
+import asyncio
 import os
 import pickle
+import time
 import numpy as np
 from typing import Dict, List, Optional, Tuple
-from deepface import DeepFace
-import cv2
-from scipy.spatial import distance
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
-# DeepFace configuration
-MODEL_NAME = "Facenet512"  # Best balance of accuracy and speed
-DISTANCE_METRIC = "cosine"  # cosine, euclidean, euclidean_l2
-DETECTOR_BACKEND = "opencv"  # opencv, ssd, dlib, mtcnn, retinaface
+from face_inference import (
+    MODEL_NAME, DISTANCE_METRIC, DETECTOR_BACKEND,
+    extract_embedding, extract_embedding_async, detect_face,
+    face_inference, face_batcher, InferenceBusy
+)
+from face_cache import TTLCache, content_hash
+from face_cascade import face_cascade
+from face_gallery import FaceGallery, IVFIndex, normalize
+from face_store import EmbeddingStore
+from app.core.config import get_settings
 
 # Face storage directory
 FACES_DIR = "student_faces"
-FACE_DATABASE_FILE = "face_encodings.pkl"
+FACE_STORE_DIR = "face_store"
+FACE_DATABASE_FILE = "face_encodings.pkl"  # legacy pickle, imported once into the store
+FACE_INDEX_FILE = "face_ivf_index.npz"
 
 class FaceRecognitionService:
     def __init__(self):
-        self.face_database: List[Dict] = []
+        self.store = EmbeddingStore(FACE_STORE_DIR)
+        
+        # Normalized matrix used for matching, optionally with an ANN index
+        settings = get_settings()
+        index = None
+        if settings.FACE_SEARCH == "ivf":
+            index = IVFIndex(
+                n_lists=settings.FACE_IVF_LISTS,
+                n_probes=settings.FACE_IVF_PROBES,
+                min_size=settings.FACE_IVF_MIN_SIZE,
+                path=FACE_INDEX_FILE
+            )
+        self.gallery = FaceGallery(index)
+        self.search_stats = {"local": 0, "global_fallback": 0, "global": 0}
         self.threshold = 0.65  # Increased threshold for better matching (cosine distance)
+        self.save_images = settings.FACE_SAVE_IMAGES
+        
+        # Repeated uploads: same bytes -> prior result, same face crop -> prior embedding
+        self.result_cache = TTLCache(settings.FACE_CACHE_SIZE, settings.FACE_CACHE_TTL_SECONDS)
+        self.embedding_cache = TTLCache(settings.FACE_CACHE_SIZE, settings.FACE_CACHE_TTL_SECONDS)
         
         # Create faces directory if it doesn't exist
         if not os.path.exists(FACES_DIR):
@@ -34,31 +59,90 @@ class FaceRecognitionService:
         self.load_database()
     
     def load_database(self):
-        """Load face encodings from pickle file"""
-        if os.path.exists(FACE_DATABASE_FILE):
-            try:
-                with open(FACE_DATABASE_FILE, 'rb') as f:
-                    self.face_database = pickle.load(f)
-                print(f"✓ Loaded {len(self.face_database)} face encodings")
-                
-                # Display loaded students
-                students = set([entry['roll_no'] for entry in self.face_database])
-                print(f"✓ Known students: {len(students)}")
-            except Exception as e:
-                print(f"Error loading face database: {e}")
-                self.face_database = []
-        else:
-            print("No existing face database found. Starting fresh.")
-            self.face_database = []
-    
-    def save_database(self):
-        """Save face encodings to pickle file"""
+        """Load face encodings from the embedding store"""
         try:
-            with open(FACE_DATABASE_FILE, 'wb') as f:
-                pickle.dump(self.face_database, f)
-            print(f"✓ Saved face database with {len(self.face_database)} encodings")
+            if not self.store.exists():
+                self.import_legacy_database()
+            matrix, rows = self.store.load()
+            self.gallery.load_matrix(matrix, rows, self.store.version)
+            self.result_cache.clear()
+            print(f"✓ Loaded {len(self.gallery)} face encodings")
+            print(f"✓ Known students: {len(self.gallery.students())}")
         except Exception as e:
-            print(f"Error saving face database: {e}")
+            print(f"Error loading face database: {e}")
+            self.gallery.rebuild([])
+    
+    def import_legacy_database(self):
+        """One-time import of face_encodings.pkl into the embedding store"""
+        if not os.path.exists(FACE_DATABASE_FILE):
+            print("No existing face database found. Starting fresh.")
+            return
+        with open(FACE_DATABASE_FILE, 'rb') as f:
+            entries = pickle.load(f)
+        if not entries:
+            return
+        matrix = normalize(np.stack([np.asarray(e['embedding'], dtype=np.float32) for e in entries]))
+        rows = [
+            {
+                'roll_no': e['roll_no'],
+                'name': e['name'],
+                'view': e.get('view', 'unknown'),
+                'image_path': e.get('image_path')
+            }
+            for e in entries
+        ]
+        self.store.replace(matrix, rows)
+        print(f"✓ Imported {len(rows)} face encodings from {FACE_DATABASE_FILE}")
+    
+    def sync(self):
+        """Apply enrollments and removals logged by any worker since the last sync"""
+        changes = self.store.changes()
+        if changes is None:
+            # Snapshot was compacted; reopen the shared copy
+            self.load_database()
+            return
+        if changes:
+            self.result_cache.clear()  # cached matches may no longer hold
+        pending: List[Dict] = []
+        for record in changes:
+            if record["op"] == "add":
+                pending.append(record)
+                continue
+            self.gallery.add(pending)
+            pending = []
+            self.gallery.remove(record["roll_no"])
+        self.gallery.add(pending)
+    
+    async def load_bus_assignments(self, db: AsyncIOMotorDatabase):
+        """Load every student's assigned bus to partition the gallery"""
+        cursor = db.users.find({"role": "student"}, {"_id": 0, "roll_no": 1, "assignedBus": 1, "busNumber": 1})
+        assignments = {
+            student["roll_no"]: student.get("assignedBus") or student.get("busNumber")
+            async for student in cursor
+            if student.get("roll_no")
+        }
+        self.gallery.set_buses(assignments)
+        print(f"✓ Face gallery partitioned for {len(assignments)} students")
+    
+    def set_student_bus(self, roll_no: str, bus_number: Optional[str]):
+        """Move a student's encodings to another bus partition"""
+        self.gallery.set_bus(roll_no, bus_number)
+        self.result_cache.clear()
+    
+    def rename_bus(self, bus_number: str, new_number: str):
+        self.gallery.rename_bus(bus_number, new_number)
+        face_cascade.rename_bus(bus_number, new_number)
+        self.result_cache.clear()
+    
+    def save_image_async(self, image_path: str, image_data: bytes):
+        """Persist an image off the event loop without delaying the caller"""
+        def write():
+            try:
+                with open(image_path, 'wb') as f:
+                    f.write(image_data)
+            except Exception as e:
+                print(f"  ✗ Failed to save {image_path}: {e}")
+        asyncio.get_running_loop().run_in_executor(None, write)
     
     async def add_student_faces(
         self, 
@@ -86,7 +170,8 @@ class FaceRecognitionService:
         try:
             # Create student directory
             student_dir = os.path.join(FACES_DIR, roll_no)
-            os.makedirs(student_dir, exist_ok=True)
+            if self.save_images:
+                os.makedirs(student_dir, exist_ok=True)
             
             images = {
                 'front': front_image,
@@ -95,45 +180,55 @@ class FaceRecognitionService:
             }
             
             encodings = []
+            new_entries = []
+            
+            # Encode all views concurrently so they share one batched forward pass
+            results = await asyncio.gather(
+                *(extract_embedding_async(image_data) for image_data in images.values()),
+                return_exceptions=True
+            )
             
             # Process each image
-            for view, image_data in images.items():
-                # Save image file
+            for (view, image_data), embedding_obj in zip(images.items(), results):
+                # Keep the uploaded bytes as-is, written in the background
                 image_path = os.path.join(student_dir, f"{view}.jpg")
-                with open(image_path, 'wb') as f:
-                    f.write(image_data)
+                if self.save_images:
+                    self.save_image_async(image_path, image_data)
                 
-                # Generate face encoding
                 try:
-                    embedding_obj = DeepFace.represent(
-                        img_path=image_path,
-                        model_name=MODEL_NAME,
-                        detector_backend=DETECTOR_BACKEND,
-                        enforce_detection=True
-                    )
+                    if isinstance(embedding_obj, Exception):
+                        raise embedding_obj
+                    if embedding_obj.get("status") != "success":
+                        raise ValueError(embedding_obj.get("message"))
+                    
+                    # Add to database
+                    new_entries.append({
+                        'roll_no': roll_no,
+                        'name': name,
+                        'embedding': embedding_obj["embedding"],
+                        'view': view,
+                        'image_path': image_path if self.save_images else None
+                    })
                     
-                    if embedding_obj:
-                        embedding = embedding_obj[0]["embedding"]
-                        
-                        # Add to database
-                        self.face_database.append({
-                            'roll_no': roll_no,
-                            'name': name,
-                            'embedding': embedding,
-                            'view': view,
-                            'image_path': image_path
-                        })
-                        
-                        encodings.append(view)
-                        print(f"  ✓ Encoded {view} view for {roll_no}")
+                    encodings.append(view)
+                    print(f"  ✓ Encoded {view} view for {roll_no}")
                 
+                except InferenceBusy:
+                    raise
                 except Exception as e:
                     print(f"  ✗ Failed to encode {view} view: {str(e)}")
                     # Continue with other images even if one fails
             
             if encodings:
-                # Save updated database
-                self.save_database()
+                # Append to the embedding store, then pick the new rows up in the gallery
+                student = await db.users.find_one({"roll_no": roll_no}, {"assignedBus": 1, "busNumber": 1}) or {}
+                self.gallery.set_bus(roll_no, student.get("assignedBus") or student.get("busNumber"))
+                self.store.append(
+                    [{k: v for k, v in entry.items() if k != 'embedding'} for entry in new_entries],
+                    normalize(np.stack([np.asarray(e['embedding'], dtype=np.float32) for e in new_entries]))
+                )
+                self.sync()
+                print(f"✓ Saved face database with {len(self.gallery)} encodings")
                 
                 # Update student record in MongoDB with face_enrolled flag
                 await db.users.update_one(
@@ -145,7 +240,7 @@ class FaceRecognitionService:
                     "status": "success",
                     "message": f"Face enrollment successful for {name}",
                     "encoded_views": encodings,
-                    "total_encodings": len(self.face_database)
+                    "total_encodings": len(self.gallery)
                 }
             else:
                 return {
@@ -153,6 +248,8 @@ class FaceRecognitionService:
                     "message": "Failed to encode any face images"
                 }
         
+        except InferenceBusy:
+            raise
         except Exception as e:
             return {
                 "status": "error",
@@ -164,7 +261,7 @@ class FaceRecognitionService:
         image_data: bytes
     ) -> Dict:
         """
-        Recognize face from image data
+        Recognize face from image data (blocking; runs inference inline)
         
         Args:
             image_data: Image bytes from ESP32-CAM
@@ -172,80 +269,140 @@ class FaceRecognitionService:
         Returns:
             Dict with recognition results
         """
-        if not self.face_database:
+        self.sync()
+        if not len(self.gallery):
             return {
                 "status": "error",
                 "message": "Face database is empty. No students enrolled yet."
             }
         
         try:
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if image is None:
-                return {"status": "error", "message": "Failed to decode image"}
-            
-            # Save temporary image for DeepFace
-            temp_image_path = "temp_recognition.jpg"
-            cv2.imwrite(temp_image_path, image)
-            
-            # Extract embedding from captured image
-            try:
-                captured_embedding_obj = DeepFace.represent(
-                    img_path=temp_image_path,
-                    model_name=MODEL_NAME,
-                    detector_backend=DETECTOR_BACKEND,
-                    enforce_detection=True
-                )
-            except Exception as e:
-                # Clean up temp file
-                if os.path.exists(temp_image_path):
-                    os.remove(temp_image_path)
-                
-                if "Face could not be detected" in str(e):
-                    return {"status": "error", "message": "No face detected in image"}
-                return {"status": "error", "message": f"Face detection error: {str(e)}"}
-            
-            # Clean up temp file
-            if os.path.exists(temp_image_path):
-                os.remove(temp_image_path)
-            
-            if not captured_embedding_obj:
-                return {"status": "error", "message": "No face detected"}
-            
-            captured_embedding = captured_embedding_obj[0]["embedding"]
-            facial_area = captured_embedding_obj[0]["facial_area"]
+            return self.match_embedding(extract_embedding(image_data))
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": f"Recognition error: {str(e)}"
+            }
+    
+    async def recognize_face_async(
+        self,
+        image_data: bytes,
+        bus_number: Optional[str] = None
+    ) -> Dict:
+        """
+        Recognize face from image data with inference on the worker pool
+        bus_number restricts the first pass to that bus's riders
+        Raises InferenceBusy when the pool's queue is full
+        """
+        self.sync()
+        if not len(self.gallery):
+            return {
+                "status": "error",
+                "message": "Face database is empty. No students enrolled yet."
+            }
+        
+        key = (bus_number, content_hash(image_data))
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            print("♻️  Duplicate frame - reusing recognition result")
+            return {**cached, "cached": True}
+        
+        try:
+            extracted = await self.extract_embedding_cached(image_data, face_cascade.config(bus_number), bus_number)
+            result = self.match_embedding(extracted, bus_number)
+            self.result_cache.put(key, result)
+            return result
+        except InferenceBusy:
+            raise
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": f"Recognition error: {str(e)}"
+            }
+    
+    async def extract_embedding_cached(
+        self,
+        image_data: bytes,
+        cascade: Optional[Dict] = None,
+        bus_number: Optional[str] = None
+    ) -> Dict:
+        """
+        Detect on the worker pool (behind the cascade pre-filter), then reuse
+        the embedding of a byte-identical face crop from the same bus seen
+        within the TTL. The key is an exact hash: a perceptual hash can
+        collide across two similar-looking students.
+        """
+        detected = await face_inference.run(detect_face, image_data, cascade)
+        face_cascade.record(detected)
+        if detected["status"] != "success":
+            return detected
+        
+        face_key = (bus_number, content_hash(np.ascontiguousarray(detected["face"]).tobytes()))
+        embedding = self.embedding_cache.get(face_key)
+        if embedding is None:
+            started = time.perf_counter()
+            embedding = await face_batcher.embed(detected["face"])
+            face_cascade.record_stage("embed", time.perf_counter() - started)
+            self.embedding_cache.put(face_key, embedding)
+        return {
+            "status": "success",
+            "embedding": embedding,
+            "facial_area": detected["facial_area"]
+        }
+    
+    def match_embedding(self, extracted: Dict, bus_number: Optional[str] = None) -> Dict:
+        """
+        Match an extracted embedding against the enrolled faces
+        
+        Args:
+            extracted: Result of face_inference.extract_embedding
+            bus_number: Search this bus's riders first; the whole gallery
+                is only searched when none of them is within the threshold
+        
+        Returns:
+            Dict with recognition results
+        """
+        if extracted.get("status") != "success":
+            return extracted
+        
+        try:
+            captured_embedding = extracted["embedding"]
+            facial_area = extracted["facial_area"]
             
-            # Compare with all known faces
-            min_distance = float('inf')
-            best_match_roll_no = None
-            best_match_name = None
-            all_distances = []  # Track all distances for debugging
+            top_matches = []
+            if bus_number:
+                # First pass: only students assigned to this bus
+                print(f"\n🔍 Comparing with {len(self.gallery.partition(bus_number))} face encodings on {bus_number}...")
+                top_matches = self.gallery.search(captured_embedding, k=3, bus_number=bus_number)
+                if top_matches and top_matches[0][1] <= self.threshold:
+                    self.search_stats["local"] += 1
+                else:
+                    top_matches = []
+                    self.search_stats["global_fallback"] += 1
+            else:
+                self.search_stats["global"] += 1
             
-            print(f"\n🔍 Comparing with {len(self.face_database)} face encodings...")
+            if not top_matches:
+                # Compare with all known faces in one matrix-vector product
+                print(f"\n🔍 Comparing with {len(self.gallery)} face encodings...")
+                top_matches = self.gallery.search(captured_embedding, k=3)
+            if not top_matches:
+                return {
+                    "status": "error",
+                    "message": "Face database is empty. No students enrolled yet."
+                }
             
-            for db_entry in self.face_database:
-                # Calculate cosine distance
-                dist = distance.cosine(captured_embedding, db_entry['embedding'])
-                all_distances.append({
-                    'roll_no': db_entry['roll_no'],
-                    'name': db_entry['name'],
-                    'view': db_entry.get('view', 'unknown'),
-                    'distance': dist
-                })
-                
-                if dist < min_distance:
-                    min_distance = dist
-                    best_match_roll_no = db_entry['roll_no']
-                    best_match_name = db_entry['name']
+            best_row, min_distance = top_matches[0]
+            best_match = self.gallery.entry(best_row)
+            best_match_roll_no = best_match['roll_no']
+            best_match_name = best_match['name']
             
-            # Sort and display top 3 matches
-            all_distances.sort(key=lambda x: x['distance'])
+            # Display top 3 matches
             print(f"\n📊 Top 3 matches:")
-            for i, match in enumerate(all_distances[:3], 1):
+            for i, (row, dist) in enumerate(top_matches, 1):
+                match = self.gallery.entry(row)
                 print(f"   {i}. {match['name']} ({match['roll_no']}) - {match['view']} view")
-                print(f"      Distance: {match['distance']:.4f}, Confidence: {1-match['distance']:.4f}")
+                print(f"      Distance: {dist:.4f}, Confidence: {1-dist:.4f}")
             
             print(f"\n⚙️  Threshold: {self.threshold}")
             print(f"   Best match distance: {min_distance:.4f}")
@@ -295,12 +452,9 @@ class FaceRecognitionService:
     async def remove_student_faces(self, roll_no: str, db: AsyncIOMotorDatabase):
         """Remove student face encodings and images"""
         try:
-            # Remove from database
-            self.face_database = [
-                entry for entry in self.face_database 
-                if entry['roll_no'] != roll_no
-            ]
-            self.save_database()
+            # Tombstone in the embedding store, then drop from the gallery
+            self.store.tombstone(roll_no)
+            self.sync()
             
             # Remove directory
             student_dir = os.path.join(FACES_DIR, roll_no)
@@ -0,0 +1,269 @@
+"""
+Face Embedding Store
+On-disk face gallery shared by every worker:
+  embeddings.npy  fixed-width float32 matrix, opened with np.memmap so
+                  workers share one page-cached copy
+  meta.json       roll_no / name / view / image_path for every row, plus
+                  the gallery version (bumped whenever it is re-encoded)
+  log.bin         float32 rows appended since the last compaction
+  log.jsonl       append-only add / remove (tombstone) records
+Enrollments and removals only append to the log; compaction folds the
+log back into a fresh snapshot and swaps it in atomically.
+"""
+import json
+import os
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+COMPACT_AFTER = 256  # log records before the snapshot is rewritten
+
+
+class EmbeddingStore:
+    def __init__(self, directory: str, compact_after: int = COMPACT_AFTER):
+        self.directory = directory
+        self.compact_after = compact_after
+        self.base_path = os.path.join(directory, "embeddings.npy")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.log_vectors_path = os.path.join(directory, "log.bin")
+        self.log_path = os.path.join(directory, "log.jsonl")
+        self.lock_path = os.path.join(directory, "store.lock")
+        os.makedirs(directory, exist_ok=True)
+
+        # Read position, so sync() only replays records this process has not seen
+        self.base_stamp: Optional[Tuple[int, int]] = None
+        self.log_offset = 0
+        self.log_records = 0
+        self.version = 0
+        self.info: Dict[str, Any] = {}
+
+    def exists(self) -> bool:
+        return os.path.exists(self.base_path) and os.path.exists(self.meta_path)
+
+    @contextmanager
+    def _lock(self):
+        """Exclusive lock so writers in different workers never interleave"""
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    # ---------- snapshot ----------
+
+    def _read_base(self) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        if not self.exists():
+            return np.empty((0, 0), dtype=np.float32), []
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        self.version = meta.get("version", 0)
+        self.info = meta.get("info", {})
+        rows = meta["rows"]
+        if not rows:
+            return np.empty((0, meta.get("dim", 0)), dtype=np.float32), []
+        return np.load(self.base_path, mmap_mode="r"), rows
+
+    def _write_base(
+        self,
+        matrix: np.ndarray,
+        rows: List[Dict[str, Any]],
+        version: Optional[int] = None,
+        info: Optional[Dict[str, Any]] = None
+    ):
+        """Write a new snapshot beside the old one and swap it in"""
+        tmp_base = self.base_path + ".tmp.npy"
+        tmp_meta = self.meta_path + ".tmp"
+        np.save(tmp_base, np.ascontiguousarray(matrix, dtype=np.float32))
+        meta = {
+            "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+            "version": self.version if version is None else version,
+            "info": self.info if info is None else info,
+            "rows": rows
+        }
+        with open(tmp_meta, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_base, self.base_path)
+        os.replace(tmp_meta, self.meta_path)
+        # The log is folded into the snapshot
+        open(self.log_path, "w").close()
+        open(self.log_vectors_path, "wb").close()
+
+    # ---------- log ----------
+
+    def _read_log(self, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Complete log records from a byte offset, and the offset after them"""
+        if not os.path.exists(self.log_path):
+            return [], offset
+        with open(self.log_path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # a writer may be mid-line
+        records = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        return records, offset + end
+
+    def _log_vectors(self, start: int, count: int, dim: int) -> np.ndarray:
+        itemsize = np.dtype(np.float32).itemsize
+        with open(self.log_vectors_path, "rb") as f:
+            f.seek(start * dim * itemsize)
+            return np.fromfile(f, dtype=np.float32, count=count * dim).reshape(count, dim)
+
+    def _append_records(self, records: List[Dict[str, Any]], vectors: Optional[np.ndarray] = None):
+        if vectors is not None and len(vectors):
+            # Vectors first, so a record never points at rows that are not on disk
+            with open(self.log_vectors_path, "ab") as f:
+                start = f.tell() // (vectors.shape[1] * np.dtype(np.float32).itemsize)
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            for offset, record in enumerate(records):
+                record["vector"] = start + offset
+                record["dim"] = int(vectors.shape[1])
+        with open(self.log_path, "a") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    # ---------- public API ----------
+
+    def load(self) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        """
+        Live matrix and row metadata. Pending log records are compacted
+        first, so the matrix returned is the shared read-only memmap.
+        """
+        with self._lock():
+            records, _ = self._read_log(0)
+            if records:
+                self._compact_locked()
+            matrix, rows = self._read_base()
+            self.base_stamp = self._stamp()
+            self.log_offset = 0
+            self.log_records = 0
+        return matrix, rows
+
+    def changes(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Log records written (by any worker) since the last load or call,
+        with "embedding" attached to adds. None means the snapshot was
+        replaced and the caller must load() again.
+        """
+        if self._stamp() != self.base_stamp:
+            return None
+        records, self.log_offset = self._read_log(self.log_offset)
+        self.log_records += len(records)
+        for record in records:
+            if record["op"] == "add":
+                record["embedding"] = self._log_vectors(record["vector"], 1, record["dim"])[0]
+        return records
+
+    def append(self, rows: List[Dict[str, Any]], vectors: np.ndarray):
+        """Record new encodings (rows hold roll_no, name, view, image_path)"""
+        with self._lock():
+            self._append_records([{"op": "add", **row} for row in rows], vectors)
+            self._maybe_compact_locked()
+
+    def tombstone(self, roll_no: str):
+        """Record that every encoding of a student was removed"""
+        with self._lock():
+            self._append_records([{"op": "remove", "roll_no": roll_no}])
+            self._maybe_compact_locked()
+
+    def live_rows(self) -> List[Dict[str, Any]]:
+        """Metadata of every live row, snapshot plus log (no vectors)"""
+        with self._lock():
+            return self._live_rows_locked()
+
+    def live_matrix(self) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        """Every live row and its vector, snapshot plus log, without compacting"""
+        with self._lock():
+            return self._live_matrix_locked()
+
+    def _live_rows_locked(self) -> List[Dict[str, Any]]:
+        _, rows = self._read_base()
+        records, _ = self._read_log(0)
+        rows = list(rows)
+        for record in records:
+            if record["op"] == "add":
+                rows.append({k: v for k, v in record.items() if k not in ("op", "vector", "dim")})
+            elif record["op"] == "remove":
+                rows = [row for row in rows if row["roll_no"] != record["roll_no"]]
+        return rows
+
+    def replace(
+        self,
+        matrix: np.ndarray,
+        rows: List[Dict[str, Any]],
+        expected: Optional[List[Dict[str, Any]]] = None,
+        info: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Swap in a whole new gallery version (re-encoding, legacy import).
+        With expected, only swaps if the live rows still match it, so
+        enrollments made meanwhile are never silently dropped.
+        """
+        with self._lock():
+            if expected is not None and self._live_rows_locked() != expected:
+                return False
+            self._read_base()
+            self._write_base(matrix, rows, version=self.version + 1, info=info)
+        return True
+
+    def _maybe_compact_locked(self):
+        records, _ = self._read_log(0)
+        if len(records) >= self.compact_after:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        records, _ = self._read_log(0)
+        matrix, rows = self._live_matrix_locked()
+        self._write_base(matrix, rows)
+        print(f"✓ Compacted face store: {len(rows)} encodings, {len(records)} log records folded")
+
+    def _live_matrix_locked(self) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        matrix, rows = self._read_base()
+        records, _ = self._read_log(0)
+        dim = matrix.shape[1] if matrix.ndim == 2 else 0
+
+        # (metadata, source): source >= 0 is a snapshot row, -1 - k is log vector k
+        entries = [(row, i) for i, row in enumerate(rows)]
+        for record in records:
+            if record["op"] == "add":
+                dim = record["dim"]
+                meta = {k: v for k, v in record.items() if k not in ("op", "vector", "dim")}
+                entries.append((meta, -1 - record["vector"]))
+            elif record["op"] == "remove":
+                entries = [e for e in entries if e[0]["roll_no"] != record["roll_no"]]
+
+        compacted = np.empty((len(entries), dim), dtype=np.float32)
+        sources = np.asarray([source for _, source in entries], dtype=np.int64)
+        from_base = sources >= 0
+        if from_base.any():
+            compacted[from_base] = matrix[sources[from_base]]
+        if (~from_base).any():
+            log_matrix = np.fromfile(self.log_vectors_path, dtype=np.float32).reshape(-1, dim)
+            compacted[~from_base] = log_matrix[-1 - sources[~from_base]]
+        return compacted, [meta for meta, _ in entries]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "version": self.version,
+            "info": self.info,
+            "log_records": self.log_records,
+            "compact_after": self.compact_after
+        }
@@ -0,0 +1,136 @@
+"""
+Load test: latency of an unrelated endpoint during a login storm
+Fires a burst of concurrent logins while a poller keeps calling a cheap
+endpoint, and reports the poller's p50 / p99 latency:
+  baseline  no logins running
+  inline    bcrypt verify called directly in the handler (the old login)
+  pool      bcrypt verify on the bounded PasswordHasher pool (the new login)
+
+By default everything runs in-process against a minimal app (no MongoDB
+needed). With --url, the burst goes to a running server's /api/login
+(every request uses --email / --password) and the poller calls /health.
+
+Usage: python loadtest_auth.py [--logins 500] [--workers 2]
+       python loadtest_auth.py --url http://localhost:3000 --email E --password P
+"""
+import argparse
+import asyncio
+import itertools
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.core.security import PasswordHasher, hash_password, verify_password
+
+POLL_INTERVAL = 0.01  # seconds between poller requests (open loop)
+PASSWORD = "student123"
+
+
+def build_app(workers: int, logins: int) -> FastAPI:
+    """Login endpoints in both styles plus an unrelated cheap endpoint"""
+    app = FastAPI()
+    hashed = hash_password(PASSWORD)
+    hasher = PasswordHasher()
+    hasher.workers = workers
+    hasher.queue_depth = workers + logins  # measure latency, not rejections
+    hasher.executor = ThreadPoolExecutor(max_workers=workers)  # no settings needed
+    app.state.hasher = hasher
+
+    @app.post("/login-inline")
+    async def login_inline():
+        return {"valid": verify_password(PASSWORD, hashed)}
+
+    @app.post("/login")
+    async def login():
+        return {"valid": await hasher.verify(PASSWORD, hashed)}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    return app
+
+
+async def poll(client: httpx.AsyncClient, path: str, stop_at: list) -> list:
+    """
+    Call path every POLL_INTERVAL until the time in stop_at (set by the
+    caller); returns latencies in ms. Open loop: latency is measured from
+    when each request was due, and requests that fell due while the event
+    loop was blocked are still sent, so blocking shows up in the tail.
+    """
+    latencies = []
+    started = time.perf_counter()
+    for i in itertools.count():
+        due = started + i * POLL_INTERVAL
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        if stop_at and due > stop_at[0]:
+            break
+        await client.get(path)
+        latencies.append((time.perf_counter() - due) * 1000)
+    return latencies
+
+
+async def run(client: httpx.AsyncClient, login_path: str, logins: int, body: dict = None) -> tuple:
+    """(poller latencies, burst seconds, failed logins) for one burst; logins=0 is the baseline"""
+    stop_at = []
+    poller = asyncio.create_task(poll(client, "/health", stop_at))
+    await asyncio.sleep(0.2)  # poller settles before the burst
+
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(client.post(login_path, json=body) for _ in range(logins)))
+    if not logins:
+        await asyncio.sleep(1.0)
+    burst_seconds = time.perf_counter() - started
+
+    stop_at.append(time.perf_counter())
+    latencies = await poller
+    failed = sum(response.status_code != 200 for response in responses)
+    return latencies, burst_seconds, failed
+
+
+def report(label: str, latencies: list, burst_seconds: float, failed: int):
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"{label:>8} | {len(latencies):>6} | {p50:>8.1f} | {p99:>8.1f} | {max(latencies):>8.1f} | "
+          f"{burst_seconds:>7.1f} | {failed:>6}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--url")
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    print(f"\nPoller latency (ms) on /health during a burst of {args.logins} logins\n")
+    print(f"{'login':>8} | {'polls':>6} | {'p50':>8} | {'p99':>8} | {'max':>8} | {'burst s':>7} | {'failed':>6}")
+    print("-" * 66)
+
+    if args.url:
+        body = {"email": args.email, "password": args.password}
+        async with httpx.AsyncClient(base_url=args.url, timeout=None) as client:
+            report("baseline", *await run(client, "/api/login", 0))
+            report("server", *await run(client, "/api/login", args.logins, body))
+        print()
+        return
+
+    app = build_app(args.workers, args.logins)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+        report("baseline", *await run(client, "/login", 0))
+        report("inline", *await run(client, "/login-inline", args.logins))
+        report("pool", *await run(client, "/login", args.logins))
+    print(f"\npool: {app.state.hasher.get_stats()}\n")
+    app.state.hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,7 @@
 import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 import os
 
@@ -8,10 +9,19 @@ import os
 load_dotenv()
 
 from app.core.config import get_settings
+from app.core.security import password_hasher
 from app.db import get_db, close_db
+from app.indexes import ensure_indexes
 from app.routers import auth, buses, routes, attendance, students, messaging, drivers, admin, face_recognition
 from app.seed import seed_database
+from app.utils.live_fleet import live_fleet
+from app.utils.route_stops import route_stops
+from app.utils.eta import eta_engine
+from app.utils.location_history import ensure_history_collections, history_downsampler
 from mqtt_service import mqtt_service
+from face_inference import face_inference
+from face_recognition_service import face_service
+from face_cascade import face_cascade
 
 app = FastAPI(title="TripSync API")
 
@@ -48,17 +58,46 @@ async def root():
 async def health():
     return {"status": "ok"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness check: 503 until the face model has been loaded and warmed up"""
+    if not face_inference.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming_up", "face_model": face_inference.warmup}
+        )
+    return {"status": "ready", "face_model": face_inference.warmup}
+
 @app.on_event("startup")
 async def startup_event():
     """Run database seeding on startup"""
+    db = await get_db()
+    await ensure_indexes(db)
     await seed_database()
     
-    # Start MQTT service for real-time bus tracking
-    db = await get_db()
+    # Load live bus positions, then start MQTT service for real-time bus tracking
+    await live_fleet.hydrate(db)
+    await route_stops.load_all(db)
+    await eta_engine.load(db)
+    if not eta_engine.by_segment:
+        # Seed ETA statistics from recent history without holding up startup
+        app.state.eta_learning = asyncio.create_task(
+            eta_engine.learn_in_background(db, route_stops, get_settings().ETA_LEARN_DAYS)
+        )
+    await ensure_history_collections(db)
+    await face_service.load_bus_assignments(db)
+    await face_cascade.load(db)
     mqtt_service.start(db)
+    history_downsampler.start(db)
     print("✓ MQTT service started for ESP32-CAM integration")
+    
+    # Warm the face model up in the background; /ready reports when it is done
+    app.state.face_warmup = asyncio.create_task(face_inference.warm_up())
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    mqtt_service.stop()
+    await mqtt_service.stop()
+    await history_downsampler.stop()
+    face_inference.shutdown()
+    password_hasher.shutdown()
     await close_db()
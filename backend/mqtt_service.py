@@ -4,12 +4,73 @@ Handles communication with ESP32-CAM devices
 """
 import asyncio
 import json
+import math
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 import paho.mqtt.client as mqtt
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from pymongo import MongoClient
-import threading
+from pymongo import UpdateOne
+from app.utils.live_fleet import live_fleet
+from app.utils.location_history import append_fixes, history_document
+from app.utils.route_stops import route_stops
+from app.utils.eta import eta_engine
+
+# A device whose counter goes backwards after this much silence has rebooted
+DEVICE_RESTART_WINDOW_SECONDS = 30
+
+
+class LocationCoalescer:
+    """
+    Last-writer-wins buffer holding the newest location fix per bus.
+    Fixes older than the newest one already seen for a bus are dropped,
+    so each flush window writes at most one update per bus.
+    """
+    def __init__(self):
+        self.pending: Dict[str, dict] = {}
+        # bus_number -> (device_id, device_ts, received_at) of newest accepted fix
+        self.latest: Dict[str, Tuple[Optional[str], Optional[float], datetime]] = {}
+    
+    def _is_newer(self, bus_number: str, location_data: dict, device_ts: Optional[float]) -> bool:
+        previous = self.latest.get(bus_number)
+        if previous is None:
+            return True
+        
+        prev_device, prev_ts, prev_received = previous
+        received_at = location_data["timestamp"]
+        
+        # Device timestamps (ESP32 millis()) order fixes from the same device
+        if (
+            device_ts is not None
+            and prev_ts is not None
+            and location_data.get("device_id") == prev_device
+        ):
+            if device_ts > prev_ts:
+                return True
+            return (received_at - prev_received).total_seconds() > DEVICE_RESTART_WINDOW_SECONDS
+        
+        return received_at >= prev_received
+    
+    def offer(self, bus_number: str, location_data: dict, device_ts: Optional[float] = None) -> str:
+        """
+        Add a fix to the buffer.
+        Returns "accepted", "coalesced" (replaced a pending fix) or "stale" (dropped)
+        """
+        if not self._is_newer(bus_number, location_data, device_ts):
+            return "stale"
+        
+        self.latest[bus_number] = (location_data.get("device_id"), device_ts, location_data["timestamp"])
+        replaced = bus_number in self.pending
+        self.pending[bus_number] = location_data
+        return "coalesced" if replaced else "accepted"
+    
+    def drain(self) -> Dict[str, dict]:
+        """Take the newest pending fix for every bus and reset the window"""
+        pending, self.pending = self.pending, {}
+        return pending
+    
+    def __len__(self):
+        return len(self.pending)
+
 
 class MQTTService:
     def __init__(self, broker: str = "broker.hivemq.com", port: int = 1883):
@@ -20,6 +81,32 @@ class MQTTService:
         self.connected = False
         self.should_reconnect = True
         
+        # Ingestion pipeline: paho thread -> bounded queue -> batched bulk_write
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.flush_task: Optional[asyncio.Task] = None
+        self.batch_full: Optional[asyncio.Event] = None  # set once a window holds batch_size fixes
+        self.stopping = False  # set by stop(); the flush loop exits after writing its window
+        self.flush_interval = 1.0
+        self.batch_size = 500
+        self.queue_size = 10000
+        self.coalescer = LocationCoalescer()
+        self.history: List[dict] = []  # every non-stale fix, appended to the time-series tier
+        self.stats = {
+            "received": 0,
+            "dropped": 0,
+            "coalesced": 0,
+            "stale": 0,
+            "flushed": 0,
+            "failed": 0,
+            "invalid": 0,
+            "window_errors": 0,
+            "batches": 0,
+            "early_flushes": 0,
+            "history_written": 0,
+            "history_failed": 0
+        }
+        
         # Topics
         self.LOCATION_TOPIC = "tripsync/bus/+/location"  # Subscribe to all buses
         self.COMMAND_TOPIC = "tripsync/bus/{}/command"   # Publish commands to specific bus
@@ -45,7 +132,7 @@ class MQTTService:
             self.connected = False
     
     def on_message(self, client, userdata, msg):
-        """Callback when message received"""
+        """Callback when message received (runs on the paho network thread)"""
         try:
             # Parse topic to get bus number
             # Topic format: tripsync/bus/BUS1/location
@@ -63,34 +150,23 @@ class MQTTService:
             latitude = payload.get('latitude') or payload.get('lat')
             longitude = payload.get('longitude') or payload.get('long')
             device_id = payload.get('device_id')
+            device_ts = payload.get('timestamp')
+            if not isinstance(device_ts, (int, float)):
+                device_ts = None
             
             if latitude is None or longitude is None:
                 print(f"Missing location data in payload: {payload}")
                 return
             
-            # Update database using thread-safe method
-            thread = threading.Thread(
-                target=self._sync_update_location,
-                args=(bus_number, latitude, longitude, device_id)
-            )
-            thread.daemon = True
-            thread.start()
-            
-            print(f"📍 Bus {bus_number} location: ({latitude}, {longitude})")
-        
-        except json.JSONDecodeError as e:
-            print(f"Error decoding MQTT message: {e}")
-        except Exception as e:
-            print(f"Error processing MQTT message: {e}")
-    
-    def _sync_update_location(self, bus_number: str, latitude: float, longitude: float, device_id: Optional[str] = None):
-        """Synchronous update to database - runs in separate thread"""
-        try:
-            # Create a synchronous MongoDB client for this thread
-            from app.core.config import get_settings
-            settings = get_settings()
-            sync_client = MongoClient(settings.MONGO_URI)
-            sync_db = sync_client[settings.MONGO_DB]
+            # Coerce here so a bad fix never reaches the flush task
+            try:
+                latitude, longitude = float(latitude), float(longitude)
+            except (TypeError, ValueError):
+                latitude = longitude = math.nan
+            if not (math.isfinite(latitude) and math.isfinite(longitude)):
+                self._count_threadsafe("invalid")
+                print(f"Invalid location data in payload: {payload}")
+                return
             
             location_data = {
                 "lat": latitude,
@@ -101,69 +177,186 @@ class MQTTService:
             if device_id:
                 location_data["device_id"] = device_id
             
-            # Try both field names for compatibility
-            result = sync_db.buses.update_one(
-                {"$or": [{"busNumber": bus_number}, {"number": bus_number}]},
-                {
-                    "$set": {
-                        "currentLocation": location_data,
-                        "lastUpdated": datetime.utcnow()
-                    }
-                }
-            )
-            
-            if result.modified_count > 0:
-                print(f"✓ Updated location for {bus_number}")
-            else:
-                print(f"⚠ Bus {bus_number} not found in database")
-            
-            sync_client.close()
+            # Hand off to the event loop; the flush task batches the writes
+            if self.loop is None or self.queue is None:
+                return  # not started: no pipeline to count against
+            self.loop.call_soon_threadsafe(self._enqueue, bus_number, location_data, device_ts)
+        
+        except json.JSONDecodeError as e:
+            print(f"Error decoding MQTT message: {e}")
         except Exception as e:
-            print(f"Error updating location: {e}")
-    
-    async def update_bus_location(
-        self, 
-        bus_number: str, 
-        latitude: float, 
-        longitude: float,
-        device_id: Optional[str] = None
-    ):
-        """Update bus location in MongoDB"""
-        if self.db is None:
-            print("Database not initialized in MQTT service")
+            print(f"Error processing MQTT message: {e}")
+    
+    def _count_threadsafe(self, counter: str):
+        """Bump an ingestion counter from the paho thread; stats are only touched on the loop"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._count, counter)
+    
+    def _count(self, counter: str):
+        self.stats[counter] += 1
+    
+    def _enqueue(self, bus_number: str, location_data: dict, device_ts: Optional[float] = None):
+        """Put a location fix on the ingestion queue (runs on the event loop)"""
+        try:
+            self.queue.put_nowait((bus_number, location_data, device_ts))
+            self.stats["received"] += 1
+            # +1 for the fix the flush loop already took off the queue
+            if self.queue.qsize() + 1 >= self.batch_size:
+                self.batch_full.set()
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+    
+    def _drain_queue(self):
+        """Move everything queued into the coalescing buffer"""
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not None:  # None is stop()'s wake-up
+                self._coalesce(*item)
+    
+    def _coalesce(self, bus_number: str, location_data: dict, device_ts: Optional[float]):
+        outcome = self.coalescer.offer(bus_number, location_data, device_ts)
+        if outcome != "stale":
+            # Late fixes would carry their receive time and send playback backwards
+            self.history.append(history_document(bus_number, location_data))
+            # Readers see the fix immediately; MongoDB catches up on flush
+            live_fleet.update_location(bus_number, location_data)
+        if outcome != "accepted":
+            self.stats[outcome] += 1
+    
+    async def _flush_loop(self):
+        """
+        Collect fixes for one flush interval, or until batch_size fixes
+        arrive, then write one update per bus
+        """
+        while not self.stopping:
+            try:
+                item = await self.queue.get()
+                if item is None:
+                    continue  # woken by stop()
+                self._coalesce(*item)
+                if self.queue.qsize() + 1 >= self.batch_size:
+                    self.stats["early_flushes"] += 1
+                elif not self.stopping:
+                    self.batch_full.clear()
+                    try:
+                        await asyncio.wait_for(self.batch_full.wait(), self.flush_interval)
+                        self.stats["early_flushes"] += 1
+                    except asyncio.TimeoutError:
+                        pass
+                self._drain_queue()
+                await self._write_pending()
+            except Exception as e:
+                # One bad window must not stop ingestion for good
+                self.stats["window_errors"] += 1
+                print(f"Error flushing location window: {e}")
+    
+    async def flush(self):
+        """Write out everything currently queued or buffered"""
+        if self.queue is not None:
+            self._drain_queue()
+        await self._write_pending()
+    
+    async def _write_pending(self):
+        """Persist the coalesced window in bulk_write chunks of batch_size"""
+        pending = list(self.coalescer.drain().items())
+        for start in range(0, len(pending), self.batch_size):
+            await self._write_batch(pending[start:start + self.batch_size])
+        await self._write_history()
+        try:
+            await eta_engine.flush(self.db)
+        except Exception as e:
+            print(f"Error saving ETA statistics: {e}")
+    
+    async def _write_history(self):
+        """Append every fix received in the window to the location history"""
+        docs, self.history = self.history, []
+        if not docs:
             return
-        
         try:
-            location_data = {
-                "lat": latitude,
-                "long": longitude,
-                "timestamp": datetime.utcnow()
+            await append_fixes(self.db, docs)
+            self.stats["history_written"] += len(docs)
+        except Exception as e:
+            self.stats["history_failed"] += len(docs)
+            print(f"Error writing location history: {e}")
+    
+    async def _write_batch(self, batch: List[Tuple[str, dict]]):
+        """Persist a batch of location fixes with a single bulk_write"""
+        # Stop progress for the whole batch, one vectorized call per route
+        requests = []
+        for bus_number, location_data in batch:
+            state = live_fleet.get(bus_number)
+            requests.append((
+                state.route if state else None,
+                location_data["lat"],
+                location_data["long"],
+                state.progress if state else None,
+                state.elapsed(location_data["timestamp"]) if state else None
+            ))
+        try:
+            progress = await route_stops.stop_progress_many(self.db, requests)
+        except Exception as e:
+            # Still persist the locations, just without stop progress
+            print(f"Error computing stop progress: {e}")
+            progress = [None] * len(batch)
+        
+        operations = []
+        for (bus_number, location_data), request, bus_progress in zip(batch, requests, progress):
+            update = {
+                "currentLocation": location_data,
+                "lastUpdated": location_data["timestamp"]
             }
             
-            if device_id:
-                location_data["device_id"] = device_id
-            
-            result = await self.db.buses.update_one(
-                {"busNumber": bus_number},
-                {
-                    "$set": {
-                        "location": location_data,
-                        "lastUpdated": datetime.utcnow()
-                    }
-                }
-            )
+            if bus_progress is not None:
+                stop_index, along = bus_progress
+                update["currentStopIndex"] = stop_index
+                update["routeProgress"] = along
+                live_fleet.set_stop_index(bus_number, stop_index, location_data["timestamp"], along)
+                route_name = request[0]
+                eta_engine.observe(
+                    bus_number, route_name, route_stops.tables.get(route_name),
+                    stop_index, location_data["timestamp"], along
+                )
             
-            if result.modified_count > 0:
-                print(f"✓ Updated location for {bus_number}")
-            else:
-                print(f"⚠ Bus {bus_number} not found in database")
+            operations.append(UpdateOne(
+                # Try both field names for compatibility
+                {"$or": [{"busNumber": bus_number}, {"number": bus_number}]},
+                {"$set": update}
+            ))
         
+        try:
+            await self.db.buses.bulk_write(operations, ordered=False)
+            self.stats["flushed"] += len(operations)
+            self.stats["batches"] += 1
         except Exception as e:
-            print(f"Error updating bus location in database: {e}")
+            self.stats["failed"] += len(operations)
+            print(f"Error writing location batch: {e}")
+    
+    def get_stats(self) -> dict:
+        """Ingestion counters for monitoring"""
+        return {
+            **self.stats,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "buffered": len(self.coalescer),
+            "history_buffered": len(self.history),
+            "flush_interval": self.flush_interval,
+            "batch_size": self.batch_size,
+            "connected": self.connected
+        }
     
     def start(self, db: AsyncIOMotorDatabase):
-        """Start MQTT client"""
+        """Start MQTT client and the ingestion flush task (call from the event loop)"""
+        from app.core.config import get_settings
+        settings = get_settings()
+        
         self.db = db
+        self.flush_interval = settings.MQTT_FLUSH_INTERVAL
+        self.batch_size = max(1, settings.MQTT_BATCH_SIZE)
+        self.queue_size = settings.MQTT_QUEUE_SIZE
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.batch_full = asyncio.Event()
+        self.stopping = False
+        self.flush_task = self.loop.create_task(self._flush_loop())
         
         try:
             # Create MQTT client with clean session and protocol version 3.1.1
@@ -192,13 +385,22 @@ class MQTTService:
         except Exception as e:
             print(f"Error starting MQTT service: {e}")
     
-    def stop(self):
-        """Stop MQTT client"""
+    async def stop(self):
+        """Stop MQTT client and flush pending location updates"""
         self.should_reconnect = False
         if self.client:
             self.client.loop_stop()
             self.client.disconnect()
             print("MQTT service stopped")
+        
+        if self.flush_task:
+            # Let the loop finish the window it holds instead of cancelling mid-write
+            self.stopping = True
+            self.batch_full.set()
+            await self.queue.put(None)
+            await self.flush_task
+            self.flush_task = None
+        await self.flush()
     
     def publish_command(self, bus_number: str, command: dict):
         """Publish command to specific bus"""
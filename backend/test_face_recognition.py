@@ -65,10 +65,10 @@ async def test_face_recognition():
     try:
         from face_recognition_service import face_service
         print(f"  ✓ Face service loaded")
-        print(f"  ✓ Database entries: {len(face_service.face_database)}")
+        print(f"  ✓ Database entries: {len(face_service.gallery)}")
         
-        if len(face_service.face_database) > 0:
-            students = set([entry['roll_no'] for entry in face_service.face_database])
+        if len(face_service.gallery) > 0:
+            students = face_service.gallery.students()
             print(f"  ✓ Enrolled students: {len(students)}")
             print(f"  ✓ Students: {', '.join(list(students)[:5])}...")
         else:
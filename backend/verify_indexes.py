@@ -0,0 +1,41 @@
+"""
+Verify that every hot query shape is served by an index
+Runs explain() on each query in app.indexes.QUERY_SHAPES against the
+configured database and exits non-zero if any plan contains a COLLSCAN.
+
+Usage: python verify_indexes.py [--create]
+  --create  run ensure_indexes() first (what the app does at startup)
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.db import get_db, close_db
+from app.indexes import ensure_indexes, verify_query_plans
+
+
+async def main() -> int:
+    db = await get_db()
+    if "--create" in sys.argv:
+        await ensure_indexes(db)
+
+    results = await verify_query_plans(db)
+    print(f"\n{'query':<32} | {'collection':<14} | plan")
+    print("-" * 80)
+    for result in results:
+        mark = "✅" if result["ok"] else "❌"
+        print(f"{result['name']:<32} | {result['collection']:<14} | {mark} {' <- '.join(result['stages'])}")
+
+    failed = [result["name"] for result in results if not result["ok"]]
+    await close_db()
+    if failed:
+        print(f"\n❌ {len(failed)} of {len(results)} queries use a collection scan: {', '.join(failed)}")
+        return 1
+    print(f"\n✅ All {len(results)} queries use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))